@@ -0,0 +1,417 @@
+"""
+Benchmarks for the BasketballStats database.
+
+Run with: python BasketballBenchmarks.py [number of players]
+or:       python BasketballBenchmarks.py --suite [sizes ...] [--output bench_output.txt]
+or:       python BasketballBenchmarks.py --startup
+"""
+
+import argparse
+import csv
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from extraction import lxml_etree, parse_player_page
+from finalproposal import BasketballStats, STAT_COLUMNS, normalize_name
+from scraper import PlayerURLIndex
+
+SUITE_SIZES = [1000, 10000, 100000]  # Pass larger sizes (up to 10000000) on the command line
+SUITE_QUERIES = 1000  # Calls timed per query in the suite
+STARTUP_RUNS = 10  # Fresh interpreters started per command in the startup benchmark
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(PACKAGE_DIR, 'test_fixtures')
+
+
+SYLLABLES = [consonant + vowel for consonant in 'bcdfghjklmnprstvwyz' for vowel in 'aeiou']
+
+
+def synthetic_name(i):
+    """Build a pronounceable player name that is always the same for a given number."""
+    rng = random.Random(i)
+    first = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+    last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + rng.choice(['', 'n', 's', 'r', 'k'])
+    return f"{first.capitalize()} {last.capitalize()}"
+
+
+def make_roster_csv(rows, seed=0):
+    """Write a synthetic roster with the given number of players and return the file path."""
+    rng = random.Random(seed)
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Name', 'Points', 'Assists', 'Rebounds', 'FG%', '3PT%'])
+        for i in range(rows):
+            writer.writerow([
+                synthetic_name(i),
+                round(rng.uniform(0, 35), 1),
+                round(rng.uniform(0, 12), 1),
+                round(rng.uniform(0, 15), 1),
+                round(rng.uniform(30, 65), 1),
+                round(rng.uniform(0, 45), 1)
+            ])
+    return path
+
+
+def time_queries(func, args_list):
+    """Run func once per argument tuple and return the mean time per call in microseconds."""
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+def measure(func, args_list):
+    """Time func once per argument tuple and return throughput and latency percentiles.
+
+    Latencies are in microseconds; throughput is calls per second.
+    """
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'calls': len(latencies),
+        'throughput': len(latencies) / (sum(latencies) / 1e6),
+        'p50': cuts[49],
+        'p95': cuts[94],
+        'p99': cuts[98]
+    }
+
+
+def peak_memory(func, *args):
+    """Run func once and return (its result, peak memory allocated by Python in MiB)."""
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak / (1 << 20)
+
+
+def suite_row(label, result, memory=None):
+    """Format one line of the suite report."""
+    memory = f"{memory:>10.1f}" if memory is not None else f"{'':>10}"
+    return (f"{label:<24}{result['calls']:>8}{result['throughput']:>14,.0f}"
+            f"{result['p50']:>11.1f}{result['p95']:>11.1f}{result['p99']:>11.1f}{memory}")
+
+
+def bench_suite(rows, queries=SUITE_QUERIES):
+    """Time loading, lookups, aggregates, name search and page parsing for one roster size.
+
+    Returns the report lines. Every roster and query list is seeded, so runs are comparable.
+    """
+    path = make_roster_csv(rows)
+    try:
+        start = time.perf_counter()
+        stats = BasketballStats(path)
+        load_seconds = time.perf_counter() - start
+        stats.close()
+        loaded, load_memory = peak_memory(BasketballStats, path)
+        stats = loaded
+
+        rng = random.Random(3)
+        names = [synthetic_name(rng.randrange(rows)) for _ in range(queries)]
+        stat_names = [rng.choice(stats.valid_stats) for _ in range(queries)]
+        typos = [name[:3] + name[4:] for name in names]
+
+        def uncached(method):
+            # Drop cached aggregates so every call runs the SQL
+            def run(stat):
+                stats.aggregates.invalidate()
+                return method(stat)
+            return run
+
+        results = [
+            ('retrieve_player_stat', measure(stats.get_player_stat, zip(names, stat_names)), None),
+            ('find_average_stat', measure(uncached(stats.get_average), [(stat,) for stat in stat_names[:50]]), None),
+            ('average (cached)', measure(stats.get_average, [(stat,) for stat in stat_names]), None),
+            # Highs and lows are always read from the stat indexes; there is no cache to bypass
+            ('find_high_low_stat', measure(stats.get_high_low, [(stat,) for stat in stat_names]), None),
+            ('name search exact', measure(stats.search_players, [(name,) for name in names[:200]]), None),
+            ('name search typo', measure(stats.search_players, [(name,) for name in typos[:200]]), None)
+        ]
+        stats.close()
+    finally:
+        os.remove(path)
+
+    lines = [f"{rows} players: load {load_seconds:.2f} s ({rows / load_seconds:,.0f} rows/s, "
+             f"peak {load_memory:.1f} MiB)",
+             f"{'benchmark':<24}{'calls':>8}{'calls/s':>14}{'p50 us':>11}{'p95 us':>11}{'p99 us':>11}{'peak MiB':>10}"]
+    lines += [suite_row(label, result, memory) for label, result, memory in results]
+    return lines
+
+
+def positional_parse(page):
+    """The original player page parser (whole page, stats by paragraph position), kept for comparison."""
+    soup = BeautifulSoup(page, 'html.parser')
+    data = soup.find_all('p')
+
+    def extract_stat(index):
+        try:
+            return float(data[index].get_text(strip=True).replace('%', '').replace(',', ''))
+        except (ValueError, IndexError):
+            return 0.0
+
+    return {'Name': soup.find('h1').text.strip(), 'Points': extract_stat(16), 'Rebounds': extract_stat(18),
+            'Assists': extract_stat(20), 'FG_percent': extract_stat(22), 'ThreePT_percent': extract_stat(24)}
+
+
+def full_size_page(page, seasons=1500):
+    """Pad a fixture page with a long per-game table, closer to the size of a real player page."""
+    rows = ''.join(f"<tr><th>{1950 + i % 70}-{(51 + i % 70) % 100:02d}</th>" + "<td>12.3</td>" * 25 + "</tr>\n"
+                   for i in range(seasons))
+    return page.replace('</body>', f'<table id="per_game_full">{rows}</table></body>')
+
+
+def bench_parsing(repeat=50):
+    """Time parsing of the saved Basketball Reference pages in test_fixtures; returns the report lines.
+
+    Player pages are parsed with every extraction backend and the original parser, both as
+    saved and padded to a realistic size.
+    """
+    pages = {}
+    for name in os.listdir(FIXTURE_DIR):
+        with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as file:
+            pages[name] = file.read()
+    parsers = [('html.parser', lambda page: parse_player_page(page, 'html.parser')), ('old', positional_parse)]
+    if lxml_etree is not None:
+        parsers.insert(0, ('lxml', lambda page: parse_player_page(page, 'lxml')))
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = PlayerURLIndex(normalize_name, cache=None, path=os.path.join(directory, 'index.json'))
+        lines = [f"{'page':<24}{'calls':>8}{'calls/s':>14}{'p50 us':>11}{'p95 us':>11}{'p99 us':>11}{'peak MiB':>10}"]
+        for name, page in sorted(pages.items()):
+            if name.startswith('players'):
+                _, memory = peak_memory(index.parse_letter_page, page)
+                lines.append(suite_row(name, measure(index.parse_letter_page, [(page,)] * repeat), memory))
+                continue
+            stem = name[:-len('.html')]
+            for label, variant in [(stem, page), (stem + '+', full_size_page(page))]:
+                for parser, parse in parsers:
+                    _, memory = peak_memory(parse, variant)
+                    lines.append(suite_row(f"{label} {parser}", measure(parse, [(variant,)] * repeat), memory))
+    return lines
+
+
+def bench_batch(rows, edits=1000):
+    """Compare per-row commits with one batch() transaction for the same edits; returns the report lines.
+
+    Uses a database file, where every commit waits for the disk.
+    """
+    path = make_roster_csv(rows)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            stats = BasketballStats(path, db_path=os.path.join(directory, 'bench.db'))
+            rng = random.Random(4)
+            picks = [(synthetic_name(rng.randrange(rows)), {'points': round(rng.uniform(0, 35), 1)})
+                     for _ in range(edits)]
+
+            start = time.perf_counter()
+            for name, values in picks:
+                stats.update_player(name, values)
+            per_row = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with stats.batch() as batch:
+                for name, values in picks:
+                    batch.update(name, values)
+            batched = time.perf_counter() - start
+
+            start = time.perf_counter()
+            stats.undo()
+            undo = time.perf_counter() - start
+            stats.replicate_to(os.path.join(directory, 'replica.db'))  # Full copy first
+            stats.redo()
+            start = time.perf_counter()
+            copied = stats.replicate_to(os.path.join(directory, 'replica.db'))
+            replicate = time.perf_counter() - start
+            stats.close()
+    finally:
+        os.remove(path)
+
+    return [f"{edits} updates on {rows} players (edits per second)",
+            f"{'per-row commits':<24}{edits / per_row:>14,.0f}",
+            f"{'one batch':<24}{edits / batched:>14,.0f}",
+            f"{'undo batch':<24}{edits / undo:>14,.0f}",
+            f"{'replicate ' + str(copied):<24}{copied / replicate:>14,.0f}"]
+
+
+def import_time(statement):
+    """Return {module: cumulative import time in microseconds} for a statement run with python -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=PACKAGE_DIR,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times.setdefault(fields[2].strip(), int(fields[1]))
+    return times
+
+
+def bench_startup(runs=STARTUP_RUNS):
+    """Time cold starts of the command line tool, each in a fresh interpreter; returns the report lines.
+
+    None of the commands scrape, so requests and BeautifulSoup should not be imported at all.
+    """
+    script = os.path.join(PACKAGE_DIR, 'finalproposal.py')
+    commands = [
+        ('--help', ['--help']),
+        ('query --player', ['--db', ':memory:', 'query', '--player', 'Larry Bird', '--stat', 'points']),
+        ('query --summary', ['--db', ':memory:', 'query', '--summary'])
+    ]
+
+    def start(argv):
+        subprocess.run([sys.executable, script, *argv], cwd=PACKAGE_DIR, stdout=subprocess.DEVNULL, check=True)
+
+    lines = [f"{'command':<24}{'calls':>8}{'calls/s':>14}{'p50 us':>11}{'p95 us':>11}{'p99 us':>11}"]
+    lines += [suite_row(label, measure(start, [(argv,)] * runs)) for label, argv in commands]
+    times = import_time('import finalproposal, requests, extraction')
+    lines.append(f"{'import':<24}{'ms':>8}")
+    for module in ('finalproposal', 'requests', 'extraction'):
+        lines.append(f"{module:<24}{times.get(module, 0) / 1e3:>8.1f}")
+    loaded = import_time('import finalproposal')
+    lines.append("scraping modules loaded by 'import finalproposal': "
+                 + (", ".join(module for module in ('requests', 'bs4', 'extraction') if module in loaded) or "none"))
+    return lines
+
+
+def run_suite(sizes, output=None):
+    """Run bench_suite for every size plus the parsing benchmark, printing and optionally saving the report."""
+    lines = [f"Python {sys.version.split()[0]}, {time.strftime('%Y-%m-%d %H:%M:%S')}"]
+    for rows in sizes:
+        lines += [""] + bench_suite(rows)
+    lines += [""] + bench_batch(sizes[0])
+    lines += ["", "Parsing saved pages"] + bench_parsing()
+    lines += ["", "Cold start of the command line tool"] + bench_startup()
+    report = "\n".join(lines) + "\n"
+    print(report, end="")
+    if output:
+        with open(output, 'a', encoding='utf-8') as file:
+            file.write(report + "\n")
+
+
+def bench_indexes(rows):
+    """Compare name lookups and high/low queries with and without the secondary indexes."""
+    path = make_roster_csv(rows)
+    try:
+        stats = BasketballStats(path)
+        cursor = stats.connection.cursor()
+        rng = random.Random(1)
+        picks = [rng.randrange(rows) for _ in range(200)]
+        names = [(synthetic_name(i),) for i in picks]
+        columns = [(column,) for column in STAT_COLUMNS] * 4
+
+        def lookup(name):
+            cursor.execute('SELECT Points FROM stats WHERE Name = ?', (name,)).fetchone()
+
+        def high_low(column):
+            max_value, min_value = cursor.execute(
+                f'SELECT (SELECT MAX("{column}") FROM stats), (SELECT MIN("{column}") FROM stats)').fetchone()
+            cursor.execute(f'SELECT Name FROM stats WHERE "{column}" = ?', (max_value,)).fetchall()
+            cursor.execute(f'SELECT Name FROM stats WHERE "{column}" = ?', (min_value,)).fetchall()
+
+        indexed = (time_queries(lookup, names), time_queries(high_low, columns))
+        stats.drop_indexes()
+        scanned = (time_queries(lookup, names), time_queries(high_low, columns))
+        stats.close()
+    finally:
+        os.remove(path)
+
+    print(f"{rows} players (mean microseconds per call)")
+    print(f"{'query':<16}{'indexed':>12}{'full scan':>12}{'speedup':>10}")
+    for label, fast, slow in zip(['name lookup', 'high/low'], indexed, scanned):
+        print(f"{label:<16}{fast:>12.1f}{slow:>12.1f}{slow / fast:>9.0f}x")
+
+
+def bench_name_search(rows):
+    """Time exact and misspelled name searches against the old LIKE '%...%' scan."""
+    path = make_roster_csv(rows)
+    try:
+        stats = BasketballStats(path)
+        cursor = stats.connection.cursor()
+        rng = random.Random(2)
+        picks = [rng.randrange(rows) for _ in range(200)]
+        exact = [(synthetic_name(i),) for i in picks]
+        typos = [(name[0][:3] + name[0][4:],) for name in exact]
+
+        def like_scan(name):
+            cursor.execute('SELECT Name FROM stats WHERE Name LIKE ?', ('%' + name + '%',)).fetchall()
+
+        timings = [
+            ('LIKE scan', time_queries(like_scan, exact)),
+            ('search exact', time_queries(stats.search_players, exact)),
+            ('search typo', time_queries(stats.search_players, typos))
+        ]
+        stats.close()
+    finally:
+        os.remove(path)
+
+    print(f"{rows} players (mean microseconds per call)")
+    for label, micros in timings:
+        print(f"{label:<16}{micros:>12.1f}")
+
+
+def bench_engines(rows):
+    """Compare the SQLite engine with the NumPy column store on the same queries."""
+    from columnstore import ColumnStore
+
+    path = make_roster_csv(rows)
+    try:
+        start = time.perf_counter()
+        sqlite_stats = BasketballStats(path)
+        sqlite_load = time.perf_counter() - start
+        start = time.perf_counter()
+        column_store = ColumnStore(path)
+        columnar_load = time.perf_counter() - start
+
+        queries = [
+            ('summarize', lambda engine: engine.summarize()),
+            ('filter', lambda engine: engine.filter_players('points', 20, 25)),
+            ('high/low', lambda engine: engine.get_high_low('assists')),
+            ('top 10', lambda engine: engine.leaderboard('rebounds', 10)),
+            ('percentile', lambda engine: engine.percentile_rank(synthetic_name(rows // 2), 'points'))
+        ]
+        # None of these queries use the SQLite engine's aggregate cache, so both engines do the full work
+        timings = []
+        for label, query in queries:
+            timings.append((label, time_queries(query, [(sqlite_stats,)] * 5),
+                            time_queries(query, [(column_store,)] * 5)))
+        sqlite_stats.close()
+    finally:
+        os.remove(path)
+
+    print(f"{rows} players (mean milliseconds per call)")
+    print(f"{'query':<16}{'sqlite':>12}{'columnar':>12}")
+    print(f"{'load':<16}{sqlite_load * 1e3:>12.1f}{columnar_load * 1e3:>12.1f}")
+    for label, sqlite_micros, columnar_micros in timings:
+        print(f"{label:<16}{sqlite_micros / 1e3:>12.2f}{columnar_micros / 1e3:>12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the basketball stats database.")
+    parser.add_argument('sizes', nargs='*', type=int, help="numbers of players to benchmark with")
+    parser.add_argument('--suite', action='store_true',
+                        help="run the full suite (load, lookups, aggregates, name search, page parsing)")
+    parser.add_argument('--output', help="file the suite report is appended to, e.g. bench_output.txt")
+    parser.add_argument('--startup', action='store_true', help="only time cold starts of the command line tool")
+    args = parser.parse_args()
+    if args.startup:
+        print("\n".join(bench_startup()))
+    elif args.suite:
+        run_suite(args.sizes or SUITE_SIZES, args.output)
+    else:
+        size = args.sizes[0] if args.sizes else 100000
+        bench_indexes(size)
+        bench_name_search(size)
+        bench_engines(size)
@@ -6,8 +6,125 @@ Exercise: Final Proposal
 
 import unittest
 from unittest import mock
-from finalproposal import BasketballStats 
+import requests
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+from extraction import lxml_etree, parse_player_page
+from finalproposal import BasketballStats, main, normalize_name
+from scraper import BBREF_URL, HTTPCache, PlayerURLIndex
 import csv
+import io
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_fixtures')
+
+
+def read_fixture(name):
+    """Return the text of a saved Basketball Reference page."""
+    with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as file:
+        return file.read()
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response."""
+
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+class FakeSession:
+    """Serves saved pages by URL and answers 304 when the ETag still matches."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls.append((url, dict(headers or {})))
+        if url not in self.pages:
+            return FakeResponse(404)
+        etag = '"' + str(len(self.pages[url])) + '"'
+        if (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, self.pages[url], {'ETag': etag})
+
+
+class StubBBRefHandler(BaseHTTPRequestHandler):
+    """Serves the fixture pages; each player page fails once with 503 to exercise retries."""
+
+    pages = {
+        '/players/c/': 'players_c.html',
+        '/players/j/': 'players_j.html',
+        '/players/j/jamesle01.html': 'jamesle01.html',
+        '/players/c/curryst01.html': 'curryst01.html'
+    }
+    failed_once = set()
+    requested = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.requested.append(self.path)
+            first_try = self.path not in self.failed_once
+            self.failed_once.add(self.path)
+        if self.path not in self.pages:
+            self.send_error(404)
+            return
+        if first_try and self.path.endswith('.html'):
+            self.send_error(503)
+            return
+        body = read_fixture(self.pages[self.path]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def fixture_pages():
+    """Map Basketball Reference URLs to the saved fixture pages."""
+    return {
+        f'{BBREF_URL}/players/': read_fixture('players.html'),
+        f'{BBREF_URL}/players/c/': read_fixture('players_c.html'),
+        f'{BBREF_URL}/players/j/': read_fixture('players_j.html'),
+        f'{BBREF_URL}/players/j/jamesle01.html': read_fixture('jamesle01.html')
+    }
+
+
+def write_test_csv(rows):
+    """Write rows to a temporary CSV file in the basketball_data.csv layout and return its path."""
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Name', 'Points', 'Assists', 'Rebounds', 'FG%', '3PT%'])
+        writer.writerows(rows)
+    return path
+
 
 class TestBasketballStats(unittest.TestCase):
     def test_find_high_low_stat(self):
@@ -61,5 +178,1021 @@ class TestBasketballStats(unittest.TestCase):
         self.assertEqual(high_stats, expected_high)
         self.assertEqual(low_stats, expected_low)
 
+    def test_load_data_streams_in_batches(self):
+        # Load a file larger than one batch and make sure every row arrives
+        rows = [[f"Player {i}", i, 1.0, 2.0, 45.0, 'NA'] for i in range(25)]
+        path = write_test_csv(rows)
+        self.addCleanup(os.remove, path)
+
+        basketball_stats = BasketballStats(path)
+        with basketball_stats.connection:
+            basketball_stats.connection.execute('DELETE FROM stats')
+        loaded = basketball_stats.load_data(batch_size=4)
+
+        count, total, threes = basketball_stats.connection.execute(
+            'SELECT COUNT(*), SUM(Points), SUM(ThreePT_percent) FROM stats').fetchone()
+        self.assertEqual(loaded, 25)
+        self.assertEqual(count, 25)
+        self.assertEqual(total, sum(range(25)))
+        self.assertEqual(threes, 0.0)
+        self.assertEqual(basketball_stats.last_load_stats['rows'], 25)
+
+    def test_read_csv_batches_sizes(self):
+        # Batches are capped at batch_size and the last one holds the remainder
+        path = write_test_csv([[f"Player {i}", 1, 1, 1, 1, 1] for i in range(10)])
+        self.addCleanup(os.remove, path)
+
+        basketball_stats = BasketballStats(path)
+        sizes = [len(batch) for batch in basketball_stats.read_csv_batches(batch_size=4)]
+        self.assertEqual(sizes, [4, 4, 2])
+
+    def test_persistent_database_skips_reload(self):
+        # Edits survive a restart and an unchanged CSV is not loaded again
+        path = write_test_csv([["Greg Heffley", 20, 5, 10, 45, 35]])
+        self.addCleanup(os.remove, path)
+        db_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(db_dir.cleanup)
+        db_path = os.path.join(db_dir.name, 'stats.db')
+
+        basketball_stats = BasketballStats(path, db_path=db_path)
+        with basketball_stats.connection:
+            basketball_stats.connection.execute("INSERT INTO stats (Name, Points) VALUES ('Rowley Jefferson', 30)")
+        basketball_stats.close()
+
+        with mock.patch.object(BasketballStats, 'load_data') as load_data:
+            basketball_stats = BasketballStats(path, db_path=db_path)
+            load_data.assert_not_called()
+        self.assertIsNone(basketball_stats.last_load_stats)
+        count = basketball_stats.connection.execute('SELECT COUNT(*) FROM stats').fetchone()[0]
+        self.assertEqual(count, 2)
+        self.assertEqual(basketball_stats.connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        basketball_stats.close()
+
+        # Changing the CSV triggers a fresh load of the CSV rows; the added player is kept
+        with open(path, 'a') as file:
+            file.write("Rodrick Heffley,15,4,12,40,30\n")
+        basketball_stats = BasketballStats(path, db_path=db_path)
+        names = [row[0] for row in basketball_stats.connection.execute('SELECT Name FROM stats ORDER BY id')]
+        self.assertEqual(names, ["Rowley Jefferson", "Greg Heffley", "Rodrick Heffley"])
+        basketball_stats.close()
+
+    def test_lazy_load_waits_for_first_query(self):
+        # With lazy=True nothing is loaded until a query needs the data
+        path = write_test_csv([["Greg Heffley", 20, 5, 10, 45, 35]])
+        self.addCleanup(os.remove, path)
+        with mock.patch.object(BasketballStats, 'load_data', autospec=True,
+                               side_effect=BasketballStats.load_data) as load_data:
+            basketball_stats = BasketballStats(path, lazy=True)
+            load_data.assert_not_called()
+            self.assertEqual(basketball_stats.get_player_stat("Greg Heffley", "points"), 20.0)
+            self.assertEqual(basketball_stats.get_average("points"), 20.0)
+            load_data.assert_called_once()
+        basketball_stats.close()
+
+    def test_import_skips_scraping_modules(self):
+        # requests and BeautifulSoup are only imported by the commands that scrape
+        code = "import sys, finalproposal; print(sorted({'requests', 'bs4', 'extraction'} & set(sys.modules)))"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_lookups_use_indexes(self):
+        # Name and stat lookups should be index searches, not table scans
+        basketball_stats = BasketballStats("basketball_data.csv")
+        cursor = basketball_stats.connection.cursor()
+
+        plan = cursor.execute('EXPLAIN QUERY PLAN SELECT Points FROM stats WHERE Name = ?', ('Larry Bird',)).fetchall()
+        self.assertIn('USING INDEX idx_stats_name', plan[0][-1])
+
+        plan = cursor.execute('EXPLAIN QUERY PLAN SELECT Name FROM stats WHERE Rebounds = ?', (10.0,)).fetchall()
+        self.assertIn('USING COVERING INDEX idx_stats_rebounds', plan[0][-1])
+
+        ids = [row[0] for row in cursor.execute('SELECT id FROM stats ORDER BY id')]
+        self.assertEqual(ids, list(range(1, 13)))
+
+    def test_search_players_ignores_accents_and_typos(self):
+        basketball_stats = BasketballStats("basketball_data.csv")
+
+        # Accented input finds the plain spelling as a direct match
+        matches, contains = basketball_stats.search_players("Nikola Jokić")
+        self.assertTrue(contains)
+        self.assertEqual([match[1] for match in matches], ["Nikola Jokic"])
+
+        # A typo only produces ranked suggestions
+        matches, contains = basketball_stats.search_players("Lebron Jmaes")
+        self.assertFalse(contains)
+        self.assertEqual(matches[0][1], "LeBron James")
+
+    def test_name_search_stays_in_sync(self):
+        # Inserts, renames and deletes are mirrored into the search index by triggers
+        basketball_stats = BasketballStats("basketball_data.csv")
+        with basketball_stats.connection:
+            basketball_stats.connection.execute("INSERT INTO stats (Name) VALUES ('Luka Dončić')")
+        self.assertEqual(basketball_stats.search_players("luka doncic")[0][0][1], "Luka Dončić")
+
+        with basketball_stats.connection:
+            basketball_stats.connection.execute("UPDATE stats SET Name = 'Luka Doncic Jr' WHERE Name = 'Luka Dončić'")
+        self.assertEqual(basketball_stats.search_players("doncic jr")[0][0][1], "Luka Doncic Jr")
+
+        with basketball_stats.connection:
+            basketball_stats.connection.execute("DELETE FROM stats WHERE Name = 'Luka Doncic Jr'")
+        self.assertEqual(basketball_stats.search_players("doncic")[0], [])
+
+    def test_other_clients_can_write_to_the_database(self):
+        # The name search triggers only exist on our own connections, not in the file
+        db_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(db_dir.cleanup)
+        db_path = os.path.join(db_dir.name, 'stats.db')
+        BasketballStats("basketball_data.csv", db_path=db_path).close()
+
+        other = sqlite3.connect(db_path)
+        with other:
+            other.execute("INSERT INTO stats (Name, Points) VALUES ('Luka Dončić', 28.1)")
+        other.close()
+
+        # The search index catches up the next time the database is opened
+        basketball_stats = BasketballStats("basketball_data.csv", db_path=db_path)
+        self.assertEqual(basketball_stats.search_players("luka doncic")[0][0][1], "Luka Dončić")
+        basketball_stats.close()
+
+        # Removing the newest player is noticed as well
+        other = sqlite3.connect(db_path)
+        with other:
+            other.execute("DELETE FROM stats WHERE Name = 'Luka Dončić'")
+        other.close()
+        basketball_stats = BasketballStats("basketball_data.csv", db_path=db_path)
+        entries = basketball_stats.connection.execute('SELECT COUNT(*) FROM name_search').fetchone()[0]
+        self.assertEqual(entries, 12)
+        basketball_stats.close()
+
+    def test_handle_name_conflict_offers_suggestions(self):
+        basketball_stats = BasketballStats("basketball_data.csv")
+        with mock.patch('builtins.input', return_value='1'), mock.patch('builtins.print'):
+            self.assertEqual(basketball_stats.handle_name_conflict("Stephen Cury"), "Stephen Curry")
+        self.assertEqual(basketball_stats.handle_name_conflict("Larry Bird"), "Larry Bird")
+
+    def test_summarize_all_stats_in_one_query(self):
+        basketball_stats = BasketballStats("basketball_data.csv")
+        points = [row[0] for row in basketball_stats.connection.execute('SELECT Points FROM stats')]
+
+        summary = basketball_stats.summarize(stats=['points', 'FG_percent'], percentiles=(50, 90))
+        self.assertEqual(sorted(summary), ['fg%', 'points'])
+        self.assertEqual(summary['points']['count'], 12)
+        self.assertAlmostEqual(summary['points']['mean'], statistics.mean(points))
+        self.assertAlmostEqual(summary['points']['stddev'], statistics.stdev(points))
+        self.assertEqual(summary['points']['max'], 30.1)
+        self.assertEqual(summary['points']['min'], 19.0)
+        self.assertAlmostEqual(summary['points']['p50'], statistics.median(points))
+        self.assertIn('p90', summary['fg%'])
+
+        grouped = basketball_stats.summarize(stats=['rebounds'], group_by='name', percentiles=())
+        self.assertEqual(grouped['Larry Bird']['rebounds']['mean'], 10.0)
+
+        with self.assertRaises(ValueError):
+            basketball_stats.summarize(stats=['steals'])
+        for percentiles in ((50, 150), (-1,), ('median',)):
+            with self.assertRaises(ValueError):
+                basketball_stats.summarize(stats=['points'], percentiles=percentiles)
+
+    def test_aggregate_cache_follows_edits(self):
+        basketball_stats = BasketballStats("basketball_data.csv")
+        cursor = basketball_stats.connection.cursor()
+
+        def check(column):
+            average, high, low = cursor.execute(
+                f'SELECT AVG("{column}"), MAX("{column}"), MIN("{column}") FROM stats').fetchone()
+            self.assertAlmostEqual(basketball_stats.get_average(column), average)
+            max_value, _, min_value, _ = basketball_stats.get_high_low(column)
+            self.assertEqual((max_value, min_value), (high, low))
+
+        for column in ['Points', 'Rebounds']:
+            check(column)
+
+        with mock.patch('builtins.print'):
+            with mock.patch('builtins.input', side_effect=["Greg Heffley", "40", "1", "2", "60", "50"]):
+                basketball_stats.add_player()
+            check('Points')
+            self.assertEqual(basketball_stats.get_high_low('points')[1], ["Greg Heffley"])
+
+            with mock.patch('builtins.input', side_effect=["Greg Heffley", "5", "1", "30", "60", "50"]):
+                basketball_stats.edit_player_stats()
+            check('Points')
+            check('Rebounds')
+            self.assertEqual(basketball_stats.get_high_low('points')[3], ["Greg Heffley"])
+
+            with mock.patch('builtins.input', side_effect=["Greg Heffley"]):
+                basketball_stats.delete_player()
+            check('Points')
+            check('Rebounds')
+
+    def test_add_database_from_cached_pages(self):
+        # The whole scrape runs offline against the saved pages
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        basketball_stats = BasketballStats("basketball_data.csv")
+        session = FakeSession(fixture_pages())
+        basketball_stats.http_cache = HTTPCache(cache_dir.name, session=session)
+        basketball_stats.player_index = PlayerURLIndex(
+            normalize_name, basketball_stats.http_cache, os.path.join(cache_dir.name, 'index.json'))
+
+        with mock.patch('builtins.input', return_value="LeBron James"), mock.patch('builtins.print'):
+            basketball_stats.add_database()
+            basketball_stats.add_database()
+
+        rows = basketball_stats.connection.execute(
+            "SELECT Points, Assists, Rebounds FROM stats WHERE Name = 'LeBron James' ORDER BY id").fetchall()
+        self.assertEqual(rows[-1], (27.1, 7.4, 7.5))
+        # The second lookup is served from the index and cache without touching the network
+        self.assertEqual(len(session.calls), 2)
+
+
+class TestQueryAPI(unittest.TestCase):
+    def setUp(self):
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+
+    def test_programmatic_edits(self):
+        self.basketball_stats.insert_player("Greg Heffley", {'points': 40, 'fg%': 61.5})
+        self.assertEqual(self.basketball_stats.get_player_stat("Greg Heffley", "FG_percent"), 61.5)
+        self.assertIsNone(self.basketball_stats.get_player_stat("Greg Heffley", "assists"))
+        self.assertEqual(self.basketball_stats.top_n('points', 2), [("Greg Heffley", 40.0), ("Michael Jordan", 30.1)])
+
+        self.assertEqual(self.basketball_stats.update_player("Greg Heffley", {'points': 1}), 1)
+        self.assertEqual(self.basketball_stats.top_n('points', 1, ascending=True), [("Greg Heffley", 1.0)])
+        self.assertEqual(self.basketball_stats.remove_player("Greg Heffley"), 1)
+        self.assertEqual(self.basketball_stats.remove_player("Greg Heffley"), 0)
+        self.assertAlmostEqual(self.basketball_stats.averages(['points'])['points'],
+                               statistics.mean(value for _, value in self.basketball_stats.top_n('points', 100)))
+
+    def run_cli(self, *argv, stdin=''):
+        out = io.StringIO()
+        with mock.patch('sys.stdout', out), mock.patch('sys.stdin', io.StringIO(stdin)), \
+                mock.patch('sys.stderr', io.StringIO()):
+            code = main(['--db', ':memory:', *argv])
+        return code, out.getvalue()
+
+    def test_cli_reload_reports_load_speed(self):
+        code, output = self.run_cli('--json', 'reload')
+        self.assertEqual(code, 0)
+        report = json.loads(output)
+        self.assertEqual(report['rows'], 12)
+        self.assertGreater(report['rows_per_second'], 0)
+
+    def test_cli_queries(self):
+        code, output = self.run_cli('query', '--stat', 'rebounds', '--top', '2')
+        self.assertEqual((code, output), (0, "Wilt Chamberlain: 22.9\nKareem Abdul-Jabbar: 11.2\n"))
+
+        code, output = self.run_cli('--json', 'query', '--player', 'Larry Bird', '--stat', 'points')
+        self.assertEqual(json.loads(output), {'points': 24.3})
+
+        code, output = self.run_cli('query', '--player', 'Greg Heffley')
+        self.assertEqual(code, 1)
+
+    def test_cli_update_needs_a_stat(self):
+        with mock.patch('sys.stderr', io.StringIO()) as err:
+            code = main(['--db', ':memory:', 'update', 'LeBron James'])
+        self.assertEqual(code, 1)
+        self.assertIn("No stats given", err.getvalue())
+
+    def test_cli_batch_uses_one_connection(self):
+        commands = 'add "Greg Heffley" --points 40 --assists 2\n# comment\nquery --stat points --top 1\n' \
+                   'update "Greg Heffley" --points 10\nquery --stat points --bottom 1\ndelete "Greg Heffley"\n'
+        code, output = self.run_cli('batch', stdin=commands)
+        self.assertEqual(code, 0)
+        self.assertEqual(output.splitlines(), ["added: Greg Heffley", "Greg Heffley: 40.0", "updated: 1",
+                                               "Greg Heffley: 10.0", "deleted: 1"])
+
+
+class TestLeaderboards(unittest.TestCase):
+    def setUp(self):
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+
+    def test_ties_share_a_rank(self):
+        # Jordan and Chamberlain both averaged 30.1 points
+        board = self.basketball_stats.leaderboard('points', 4)
+        self.assertEqual([(entry['rank'], entry['dense_rank'], entry['name']) for entry in board],
+                         [(1, 1, "Michael Jordan"), (1, 1, "Wilt Chamberlain"), (3, 2, "Kevin Durant"),
+                          (4, 3, "LeBron James")])
+        self.assertEqual(self.basketball_stats.leaderboard('rebounds', 1, bottom=True)[0]['name'], "Stephen Curry")
+
+    def test_percentile_rank_matches_window_function(self):
+        expected = dict(self.basketball_stats.connection.execute(
+            'SELECT Name, 100.0 * PERCENT_RANK() OVER (ORDER BY Assists) FROM stats').fetchall())
+        for name, percentile in expected.items():
+            self.assertAlmostEqual(self.basketball_stats.percentile_rank(name, 'assists')['percentile'], percentile)
+        self.assertEqual(self.basketball_stats.percentile_rank("Magic Johnson", 'assists')['rank'], 1)
+        with self.assertRaises(KeyError):
+            self.basketball_stats.percentile_rank("Greg Heffley", 'assists')
+
+
+class TestQueryProfiler(unittest.TestCase):
+    def setUp(self):
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+        self.profiler = self.basketball_stats.profiler
+        self.profiler.reset()
+
+    def test_records_calls_and_rows(self):
+        for name in ["LeBron James", "Stephen Curry"]:
+            self.basketball_stats.get_player_stat(name, 'points')
+        self.assertEqual(len(list(self.basketball_stats.iter_player_rows(batch_size=5))), 12)
+        entries = {entry['query']: entry for entry in self.profiler.dump_stats()}
+        lookup = entries['SELECT "Points" FROM stats WHERE Name = ?']
+        self.assertEqual((lookup['calls'], lookup['rows']), (2, 2))
+        listing = next(entry for query, entry in entries.items() if query.startswith('SELECT Name, "Points"'))
+        self.assertEqual(listing['rows'], 12)
+
+        self.basketball_stats.insert_players([{'Name': "Greg Heffley"}, {'Name': "Rodrick Heffley"}])
+        insert = next(entry for entry in self.profiler.dump_stats() if entry['query'].startswith('INSERT INTO stats'))
+        self.assertEqual(insert['rows'], 2)
+
+    def test_slow_queries_are_logged_with_plan(self):
+        self.profiler.slow_seconds = 0
+        self.profiler.explain_slow = True
+        with self.assertLogs('basketball.slow_queries', level='WARNING') as logs:
+            self.basketball_stats.get_player_stat("LeBron James", 'points')
+        self.assertIn('SEARCH stats USING INDEX idx_stats_name', logs.output[0])
+
+    def test_pauses_between_fetches_are_not_counted(self):
+        # Only time spent inside SQLite counts, not time the caller spends between fetches
+        cursor = self.basketball_stats.connection.execute('SELECT Name FROM stats')
+        cursor.fetchone()
+        time.sleep(0.2)
+        cursor.fetchall()
+        listing = next(entry for entry in self.profiler.dump_stats() if entry['query'] == 'SELECT Name FROM stats')
+        self.assertEqual(listing['rows'], 12)
+        self.assertLess(listing['seconds'], 0.1)
+
+    def test_iteration_is_timed_per_batch(self):
+        # Iterating fetches rows in batches; fetch calls afterwards continue where iteration stopped
+        cursor = self.basketball_stats.connection.execute('SELECT id FROM stats ORDER BY id')
+        with mock.patch.object(type(cursor), 'timed', autospec=True, side_effect=type(cursor).timed) as timed:
+            first = [next(cursor)[0] for _ in range(3)]
+        timed.assert_called_once()
+        self.assertEqual(first + [cursor.fetchone()[0]] + [row[0] for row in cursor.fetchmany(2)], list(range(1, 7)))
+        self.assertEqual([row[0] for row in cursor], list(range(7, 13)))
+        listing = next(entry for entry in self.profiler.dump_stats()
+                       if entry['query'] == 'SELECT id FROM stats ORDER BY id')
+        self.assertEqual((listing['calls'], listing['rows']), (1, 12))
+
+    def test_slow_queries_are_silent_by_default(self):
+        # Library use prints nothing; the command line shows them only when asked to
+        self.profiler.slow_seconds = 0
+        stderr = io.StringIO()
+        with mock.patch('sys.stderr', stderr):
+            self.basketball_stats.get_player_stat("LeBron James", 'points')
+        self.assertEqual(stderr.getvalue(), '')
+
+        with mock.patch('sys.stdout', io.StringIO()), mock.patch('sys.stderr', stderr):
+            main(['--db', ':memory:', '--slow-query-ms', '0', 'query', '--player', 'LeBron James', '--stat', 'points'])
+        self.assertIn('slow query: ', stderr.getvalue())
+
+    def test_finds_full_scans(self):
+        self.basketball_stats.get_player_stat("LeBron James", 'points')
+        self.assertEqual(self.profiler.full_scans(), {})
+        self.basketball_stats.drop_indexes()
+        self.assertEqual(self.profiler.full_scans(), {'SELECT "Points" FROM stats WHERE Name = ?': ['SCAN stats']})
+
+    def test_prometheus_text(self):
+        self.basketball_stats.connection.execute('SELECT "Points" FROM stats').fetchall()
+        text = self.profiler.prometheus()
+        self.assertIn('basketball_query_duration_seconds_count{query="SELECT \\"Points\\" FROM stats"} 1', text)
+        self.assertIn('basketball_query_rows_total{query="SELECT \\"Points\\" FROM stats"} 12', text)
+        self.assertIn('le="+Inf"} 1', text)
+
+
+class TestBatchEdits(unittest.TestCase):
+    def setUp(self):
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+        self.basketball_stats.get_average('points')  # Build the aggregate cache so edits must keep it in step
+
+    def rows(self, connection=None):
+        connection = connection or self.basketball_stats.connection
+        return connection.execute('SELECT * FROM stats ORDER BY id').fetchall()
+
+    def assert_aggregates_match(self):
+        self.assertAlmostEqual(self.basketball_stats.get_average('points'), self.basketball_stats.connection.execute(
+            'SELECT AVG(Points) FROM stats').fetchone()[0])
+
+    def test_batch_commits_once_or_not_at_all(self):
+        statements = []
+        self.basketball_stats.connection.set_trace_callback(statements.append)
+        with self.basketball_stats.batch() as batch:
+            batch.insert("Greg Heffley", {'points': 40})
+            self.assertEqual(batch.update("LeBron James", {'points': 30, 'assists': 8}), 1)
+            self.assertEqual(batch.delete("Stephen Curry"), 1)
+        self.basketball_stats.connection.set_trace_callback(None)
+        self.assertEqual(statements.count('COMMIT'), 1)
+        self.assertEqual(self.basketball_stats.get_player_stat("LeBron James", 'assists'), 8)
+        self.assert_aggregates_match()
+
+        before = self.rows()
+        with self.assertRaises(KeyError):
+            with self.basketball_stats.batch() as batch:
+                batch.delete("Greg Heffley")
+                raise KeyError("stop")
+        self.assertEqual(self.rows(), before)
+        self.assert_aggregates_match()
+
+    def test_nested_edits_join_the_open_batch(self):
+        # insert_player inside a batch must not commit the batch early, with or without a pool
+        for basketball_stats in (self.basketball_stats, BasketballStats("basketball_data.csv", pool_size=2)):
+            self.addCleanup(basketball_stats.close)
+            basketball_stats.get_average('points')
+            before = self.rows(basketball_stats.connection)
+            with self.assertRaises(RuntimeError):
+                with basketball_stats.batch() as batch:
+                    batch.insert("Outer Guy", {'points': 1})
+                    basketball_stats.insert_player("Inner Guy", {'points': 2})
+                    raise RuntimeError("stop")
+            self.assertEqual(self.rows(basketball_stats.connection), before)
+            self.assertAlmostEqual(basketball_stats.get_average('points'), basketball_stats.connection.execute(
+                'SELECT AVG(Points) FROM stats').fetchone()[0])
+
+    def test_savepoint_rolls_back_part_of_a_batch(self):
+        points = self.basketball_stats.get_player_stat("LeBron James", 'points')
+        with self.basketball_stats.batch() as batch:
+            batch.insert("Greg Heffley", {'points': 40})
+            with self.assertRaises(ValueError):
+                with batch.savepoint():
+                    batch.delete("LeBron James")
+                    batch.update("Larry Bird", {'height': 6.9})
+        self.assertEqual(self.basketball_stats.get_player_stat("LeBron James", 'points'), points)
+        self.assertEqual(self.basketball_stats.get_player_stat("Greg Heffley", 'points'), 40)
+        self.assertEqual(self.basketball_stats.connection.execute('SELECT COUNT(*) FROM change_log').fetchone()[0], 1)
+
+    def test_undo_and_redo(self):
+        original = self.rows()
+        self.basketball_stats.insert_player("Greg Heffley", {'points': 40})
+        after_insert = self.rows()
+        with self.basketball_stats.batch() as batch:
+            batch.update("Greg Heffley", {'points': 10})
+            batch.delete("Magic Johnson")
+        edited = self.rows()
+
+        self.basketball_stats.undo()
+        self.assertEqual(self.rows(), after_insert)
+        self.basketball_stats.undo()
+        self.assertEqual(self.rows(), original)
+        self.assert_aggregates_match()
+        self.assertIsNone(self.basketball_stats.undo())
+
+        self.basketball_stats.redo()
+        self.basketball_stats.redo()
+        self.assertEqual(self.rows(), edited)
+        self.assertIsNone(self.basketball_stats.redo())
+
+        # A new edit after an undo drops the redo history
+        self.basketball_stats.undo()
+        self.basketball_stats.remove_player("Larry Bird")
+        self.assertIsNone(self.basketball_stats.redo())
+        self.assert_aggregates_match()
+
+    def test_replicate_to_file(self):
+        db_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(db_dir.cleanup)
+        path = os.path.join(db_dir.name, 'replica.db')
+        self.basketball_stats.insert_player("Greg Heffley", {'points': 40})
+        self.basketball_stats.replicate_to(path)
+
+        self.basketball_stats.update_player("Greg Heffley", {'points': 10})
+        self.basketball_stats.remove_player("Magic Johnson")
+        self.basketball_stats.undo()
+        self.assertEqual(self.basketball_stats.replicate_to(path), 3)
+        self.assertEqual(self.basketball_stats.replicate_to(path), 0)
+
+        replica = sqlite3.connect(path)
+        self.addCleanup(replica.close)
+        self.assertEqual(self.rows(replica), self.rows())
+
+        # After the CSV is reloaded the replica gets a full copy again
+        self.basketball_stats.reload_data()
+        self.basketball_stats.replicate_to(path)
+        self.assertEqual(self.rows(replica), self.rows())
+
+        # Career lines from game logs are not in the change log, so they also force a full copy
+        self.basketball_stats.add_game_logs([{'player': "Zed Z", 'season': 2023, 'date': '2023-10-24',
+                                              'points': 50}])
+        self.basketball_stats.replicate_to(path)
+        self.assertEqual(self.rows(replica), self.rows())
+        self.assertIn("Zed Z", [row[1] for row in self.rows(replica)])
+
+
+class TestConnectionPool(unittest.TestCase):
+    def run_concurrently(self, basketball_stats, readers=6, writes=50):
+        # One thread changes Greg Heffley's points and assists together while others read
+        basketball_stats.insert_player("Greg Heffley", {'points': 0, 'assists': 0})
+        errors = []
+        done = threading.Event()
+
+        def write():
+            try:
+                for i in range(1, writes + 1):
+                    basketball_stats.update_player("Greg Heffley", {'points': i, 'assists': i})
+                    basketball_stats.insert_player(f"Rookie {i}", {'points': 1})
+            except Exception as error:
+                errors.append(error)
+            finally:
+                done.set()
+
+        def read():
+            try:
+                while not done.is_set():
+                    row = basketball_stats.fetch_stat_rows("Greg Heffley")[0]
+                    if row['Points'] != row['Assists']:
+                        errors.append(AssertionError(f"Torn read: {row}"))
+                    basketball_stats.leaderboard('points', 3)
+                    basketball_stats.get_high_low('assists')
+                    basketball_stats.search_players("lebron")
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(basketball_stats.get_player_stat("Greg Heffley", 'points'), writes)
+        self.assertEqual(len(basketball_stats.filter_players('points', 1, 1)), writes)
+        self.assertEqual(basketball_stats.get_high_low('points')[0], writes)
+        self.assertAlmostEqual(basketball_stats.get_average('points'), basketball_stats.connection.execute(
+            'SELECT AVG(Points) FROM stats').fetchone()[0])
+
+    def test_memory_database_readers_and_writer(self):
+        basketball_stats = BasketballStats("basketball_data.csv", pool_size=4)
+        self.addCleanup(basketball_stats.close)
+        self.run_concurrently(basketball_stats)
+        self.assertLessEqual(basketball_stats.pool.opened, 4)
+
+    def test_file_database_readers_and_writer(self):
+        db_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(db_dir.cleanup)
+        basketball_stats = BasketballStats("basketball_data.csv", db_path=os.path.join(db_dir.name, 'stats.db'),
+                                           pool_size=4)
+        self.addCleanup(basketball_stats.close)
+        self.run_concurrently(basketball_stats)
+        with basketball_stats.pool.read() as connection:
+            with self.assertRaises(sqlite3.OperationalError):
+                connection.execute("DELETE FROM stats")
+
+    def run_with_timeout(self, target):
+        # A deadlock fails the test instead of hanging the run
+        outcome = []
+
+        def run():
+            try:
+                outcome.append(target())
+            except Exception as error:
+                outcome.append(error)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive(), "Deadlocked")
+        return outcome[0]
+
+    def test_nested_reads_reuse_the_thread_reader(self):
+        # A query made while iterating over another one's rows must not wait for a second reader
+        basketball_stats = BasketballStats("basketball_data.csv", pool_size=1)
+        self.addCleanup(basketball_stats.close)
+
+        def nested():
+            return [basketball_stats.get_player_stat(row[0], 'points')
+                    for row in basketball_stats.iter_player_rows(['points'])]
+
+        self.assertEqual(len(self.run_with_timeout(nested)), 12)
+
+    def test_write_while_reading_fails_fast(self):
+        # On an in-memory database the write would wait forever for this thread's own read
+        basketball_stats = BasketballStats("basketball_data.csv", pool_size=2)
+        self.addCleanup(basketball_stats.close)
+
+        def write_while_reading():
+            for row in basketball_stats.iter_player_rows(['points']):
+                basketball_stats.update_player(row[0], {'points': 0})
+
+        self.assertIsInstance(self.run_with_timeout(write_while_reading), sqlite3.ProgrammingError)
+        self.assertNotEqual(basketball_stats.get_player_stat("LeBron James", 'points'), 0)
+        basketball_stats.update_player("LeBron James", {'points': 0})  # Works once the read is over
+        self.assertEqual(basketball_stats.get_player_stat("LeBron James", 'points'), 0)
+
+    def test_waiting_writer_does_not_block_readers_of_the_cache(self):
+        # A writer waiting for a reader to finish must not hold the lock that reader needs next
+        basketball_stats = BasketballStats("basketball_data.csv", pool_size=2)
+        self.addCleanup(basketball_stats.close)
+        reading = threading.Event()
+
+        def write():
+            reading.wait()
+            basketball_stats.update_player("LeBron James", {'points': 0})
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+
+        def read_average():
+            with basketball_stats.reading():
+                reading.set()
+                time.sleep(0.2)  # The writer is now waiting for this read to end
+                return basketball_stats.get_average('points')
+
+        self.assertIsInstance(self.run_with_timeout(read_average), float)
+        writer.join(5)
+        self.assertFalse(writer.is_alive(), "Deadlocked")
+        self.assertEqual(basketball_stats.get_player_stat("LeBron James", 'points'), 0)
+
+    def test_readers_share_the_profiler(self):
+        basketball_stats = BasketballStats("basketball_data.csv", pool_size=2)
+        self.addCleanup(basketball_stats.close)
+        thread = threading.Thread(target=basketball_stats.get_player_stat, args=("LeBron James", 'points'))
+        thread.start()
+        thread.join()
+        entries = {entry['query']: entry for entry in basketball_stats.profiler.dump_stats()}
+        self.assertEqual(entries['SELECT "Points" FROM stats WHERE Name = ?']['calls'], 1)
+
+
+class TestSeasons(unittest.TestCase):
+    def setUp(self):
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+        self.logs = [
+            {'player': "Greg Heffley", 'season': '2022-23', 'team': 'BOS', 'date': '2022-10-20',
+             'points': 20, 'assists': 4, 'rebounds': 6, 'fgm': 8, 'fga': 16, 'tpm': 2, 'tpa': 5},
+            {'player': "Greg Heffley", 'season': '2022-23', 'team': 'BOS', 'date': '2022-10-22',
+             'points': 30, 'assists': 6, 'rebounds': 8, 'fgm': 12, 'fga': 20, 'tpm': 3, 'tpa': 5},
+            {'player': "Greg Heffley", 'season': 2023, 'team': 'LAL', 'date': '2023-10-25',
+             'points': 10, 'assists': 2, 'rebounds': 4, 'fgm': 4, 'fga': 12, 'tpm': 0, 'tpa': 0},
+            {'player': "Rowley Jefferson", 'season': 2023, 'team': 'LAL', 'date': '2023-10-25',
+             'points': 12, 'assists': 1, 'rebounds': 9, 'fgm': 5, 'fga': 9, 'tpm': 1, 'tpa': 2}
+        ]
+
+    def test_game_logs_update_career_stats(self):
+        self.basketball_stats.get_average('rebounds')
+        self.assertEqual(self.basketball_stats.add_game_logs(self.logs), 4)
+        self.assertEqual(self.basketball_stats.get_player_stat("Greg Heffley", 'points'), 20)
+        self.assertAlmostEqual(self.basketball_stats.get_player_stat("Greg Heffley", 'fg%'), 100 * 24 / 48)
+        self.assertAlmostEqual(self.basketball_stats.get_average('rebounds'), self.basketball_stats.connection.execute(
+            'SELECT AVG(Rebounds) FROM stats').fetchone()[0])
+
+        # A replaced game and a new season only recompute the affected totals
+        self.basketball_stats.add_game_logs([dict(self.logs[2], points=40)])
+        self.assertEqual(self.basketball_stats.get_player_stat("Greg Heffley", 'points'), 30)
+        self.assertEqual(self.basketball_stats.connection.execute(
+            'SELECT COUNT(*) FROM stats WHERE Name = ?', ("Greg Heffley",)).fetchone()[0], 1)
+
+        # Career lines survive a reload of the CSV
+        self.basketball_stats.reload_data()
+        self.assertEqual(self.basketball_stats.get_player_stat("Rowley Jefferson", 'rebounds'), 9)
+
+    def test_game_logs_replace_csv_line(self):
+        # A player already in the CSV keeps a single row, now computed from the game logs
+        self.basketball_stats.get_average('points')
+        self.basketball_stats.add_game_logs([{'player': "LeBron James", 'season': 2023, 'date': '2023-10-24',
+                                              'points': 50, 'assists': 10, 'rebounds': 12}])
+        count = "SELECT COUNT(*) FROM stats WHERE Name = 'LeBron James'"
+        self.assertEqual(self.basketball_stats.connection.execute(count).fetchone()[0], 1)
+        self.assertEqual(self.basketball_stats.get_player_stat("LeBron James", 'points'), 50)
+        self.assertAlmostEqual(self.basketball_stats.get_average('points'), self.basketball_stats.connection.execute(
+            'SELECT AVG(Points) FROM stats').fetchone()[0])
+
+        self.basketball_stats.reload_data()
+        self.assertEqual(self.basketball_stats.connection.execute(count).fetchone()[0], 1)
+        self.assertEqual(self.basketball_stats.get_player_stat("LeBron James", 'points'), 50)
+
+    def test_season_averages_and_leaderboard(self):
+        self.basketball_stats.add_game_logs(self.logs)
+        seasons = self.basketball_stats.season_averages("Greg Heffley")
+        self.assertEqual([(season['season'], season['games'], season['points']) for season in seasons],
+                         [('2022-23', 2, 25), ('2023-24', 1, 10)])
+        self.assertIsNone(self.basketball_stats.season_averages("Greg Heffley", '2023-24')[0]['3pt%'])
+        self.assertEqual(self.basketball_stats.season_averages("Greg Heffley", 2022, 2022)[0]['games'], 2)
+        self.assertEqual(self.basketball_stats.season_leaderboard('rebounds', 2023),
+                         [("Rowley Jefferson", 9, 1), ("Greg Heffley", 4, 1)])
+        self.assertEqual(self.basketball_stats.season_leaderboard('points', 2022, 2023, n=1),
+                         [("Greg Heffley", 20, 3)])
+        with self.assertRaises(KeyError):
+            self.basketball_stats.season_averages("Manny Heffley")
+
+    def test_load_game_logs_from_csv(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Player', 'Season', 'Team', 'Date', 'PTS', 'AST', 'TRB', 'FGM', 'FGA', '3PM', '3PA'])
+            writer.writerow(["Greg Heffley", '2023-24', 'LAL', '2023-10-25', 10, 2, 4, 4, 12, 0, 0])
+            writer.writerow(["Greg Heffley", '2023-24', 'LAL', '2023-10-27', 14, 4, 6, 6, 10, 'NA', 'NA'])
+        self.assertEqual(self.basketball_stats.load_game_logs(path, batch_size=1), 2)
+        self.assertEqual(self.basketball_stats.get_player_stat("Greg Heffley", 'assists'), 3)
+        self.assertEqual(self.basketball_stats.connection.execute('SELECT games FROM season_totals').fetchall(), [(2,)])
+
+    def test_season_queries_use_indexes(self):
+        plan = ' '.join(row[3] for row in self.basketball_stats.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM season_totals WHERE season_id BETWEEN 2020 AND 2023'))
+        self.assertIn('idx_season_totals_season', plan)
+        plan = ' '.join(row[3] for row in self.basketball_stats.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM game_logs WHERE player_id = 1 AND season_id = 2023'))
+        self.assertIn('PRIMARY KEY', plan)
+
+
+class TestPlayerOutput(unittest.TestCase):
+    def setUp(self):
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+
+    def test_display_pages_and_columns(self):
+        out = io.StringIO()
+        with mock.patch('builtins.input', side_effect=["", "q"]) as prompt:
+            self.basketball_stats.display_all_player_stats(page_size=5, columns=['points'], out=out)
+        text = out.getvalue()
+        # Two pages were shown before the user stopped
+        self.assertEqual(prompt.call_count, 2)
+        self.assertEqual(text.count("Name: "), 10)
+        self.assertIn("Points: 30.10", text)
+        self.assertNotIn("Assists:", text)
+
+        out = io.StringIO()
+        self.basketball_stats.display_all_player_stats(offset=2, limit=1, out=out)
+        self.assertEqual(out.getvalue().count("Name: "), 1)
+        self.assertIn("Name: Magic Johnson\nPoints: 19.50\nAssists: 11.20", out.getvalue())
+
+    def test_missing_stats_show_as_na(self):
+        self.basketball_stats.insert_player("Greg Heffley", {'points': 20})
+        out = io.StringIO()
+        self.basketball_stats.display_all_player_stats(offset=12, out=out)
+        self.assertIn("Name: Greg Heffley\nPoints: 20.00\nAssists: NA\n", out.getvalue())
+
+    def test_export_csv_round_trip(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        self.assertEqual(self.basketball_stats.export_stats(path), 12)
+
+        reloaded = BasketballStats(path)
+        original = list(self.basketball_stats.iter_player_rows())
+        self.assertEqual(list(reloaded.iter_player_rows(batch_size=5)), original)
+
+    def test_export_json_lines(self):
+        out = io.StringIO()
+        count = self.basketball_stats.export_stats(out, fmt='jsonl', columns=['rebounds', '3pt%'])
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(count, 12)
+        self.assertEqual(lines[0], {"Name": "Wilt Chamberlain", "Rebounds": 22.9, "3PT%": 0.0})
+        with self.assertRaises(ValueError):
+            self.basketball_stats.export_stats(out, fmt='xml')
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_export_columnar_round_trip(self):
+        # Missing stats come back as nulls instead of 0.0
+        self.basketball_stats.insert_player("Greg Heffley", {'points': 20})
+        original = list(self.basketball_stats.iter_player_rows())
+        for suffix in ['.parquet', '.arrow']:
+            handle, path = tempfile.mkstemp(suffix=suffix)
+            os.close(handle)
+            self.addCleanup(os.remove, path)
+            self.assertEqual(self.basketball_stats.export_stats(path, fmt=suffix[1:], batch_size=5), 13)
+
+            reloaded = BasketballStats(path)
+            self.assertEqual(list(reloaded.iter_player_rows()), original)
+            self.assertEqual(reloaded.get_player_stat("Greg Heffley", 'points'), 20)
+            self.assertIsNone(reloaded.get_player_stat("Greg Heffley", 'assists'))
+            reloaded.close()
+        with self.assertRaises(ValueError):
+            self.basketball_stats.export_stats('-', fmt='parquet')
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestColumnStore(unittest.TestCase):
+    def setUp(self):
+        from columnstore import ColumnStore
+        self.sqlite_stats = BasketballStats("basketball_data.csv")
+        self.column_store = ColumnStore("basketball_data.csv", capacity=4)
+
+    def test_matches_sqlite_engine(self):
+        # Both engines answer the same queries with the same results
+        for stat in ['points', 'assists', 'rebounds', 'fg%']:
+            self.assertAlmostEqual(self.column_store.get_average(stat), self.sqlite_stats.get_average(stat))
+            self.assertEqual(self.column_store.get_high_low(stat), self.sqlite_stats.get_high_low(stat))
+            self.assertEqual(self.column_store.filter_players(stat, 5, 25),
+                             self.sqlite_stats.filter_players(stat, 5, 25))
+        summary = self.column_store.summarize(stats=['points', 'rebounds'])
+        expected = self.sqlite_stats.summarize(stats=['points', 'rebounds'])
+        for stat in expected:
+            for key, value in expected[stat].items():
+                self.assertAlmostEqual(summary[stat][key], value)
+        self.assertEqual(self.column_store.get_player_stat("Larry Bird", "assists"),
+                         self.sqlite_stats.get_player_stat("Larry Bird", "assists"))
+        with self.assertRaises(KeyError):
+            self.column_store.get_player_stat("Greg Heffley", "points")
+
+    def test_leaderboards_match_sqlite_engine(self):
+        for stat in ['points', 'assists', 'fg%']:
+            for n in [1, 2, 5, 20]:
+                self.assertEqual(self.column_store.leaderboard(stat, n), self.sqlite_stats.leaderboard(stat, n))
+                self.assertEqual(self.column_store.leaderboard(stat, n, bottom=True),
+                                 self.sqlite_stats.leaderboard(stat, n, bottom=True))
+            self.assertEqual(self.column_store.percentile_rank("Magic Johnson", stat),
+                             self.sqlite_stats.percentile_rank("Magic Johnson", stat))
+
+    def test_missing_values_are_masked(self):
+        # Wilt Chamberlain's 3PT% is NA: skipped instead of counted as 0.0
+        self.assertIsNone(self.column_store.get_player_stat("Wilt Chamberlain", "3pt%"))
+        self.assertEqual(self.column_store.summarize(stats=['3pt%'])['3pt%']['count'], 11)
+        self.column_store.insert_players([{'Name': "Greg Heffley", 'Points': 40.0}])
+        self.assertEqual(self.column_store.get_high_low('points')[1], ["Greg Heffley"])
+        self.assertEqual(self.column_store.summarize(stats=['assists'])['assists']['count'], 12)
+
+
+@unittest.skipIf(numpy is None or pyarrow is None, "NumPy or pyarrow is not installed")
+class TestColumnStoreArrow(unittest.TestCase):
+    def test_loads_arrow_with_nulls(self):
+        from columnstore import ColumnStore
+        handle, path = tempfile.mkstemp(suffix='.arrow')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        sqlite_stats = BasketballStats("basketball_data.csv")
+        sqlite_stats.insert_player("Greg Heffley", {'points': 40, 'fg%': 50})
+        sqlite_stats.export_stats(path, fmt='arrow')
+
+        column_store = ColumnStore(path, capacity=4)
+        self.assertEqual(column_store.size, 13)
+        self.assertEqual(column_store.get_high_low('points'), sqlite_stats.get_high_low('points'))
+        self.assertIsNone(column_store.get_player_stat("Greg Heffley", 'rebounds'))
+        self.assertAlmostEqual(column_store.get_average('rebounds'), sqlite_stats.get_average('rebounds'))
+
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        StubBBRefHandler.failed_once = set()
+        StubBBRefHandler.requested = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubBBRefHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.basketball_stats = BasketballStats("basketball_data.csv")
+        self.basketball_stats.http_cache = HTTPCache(cache_dir.name)
+        self.basketball_stats.player_index = PlayerURLIndex(
+            normalize_name, self.basketball_stats.http_cache, os.path.join(cache_dir.name, 'index.json'),
+            self.base_url)
+
+    def test_bulk_import_fetches_concurrently_and_retries(self):
+        names_file = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+        names_file.write("LeBron James\nStephen Curry\nNobody Real\nLeBron James\nMike James\n")
+        names_file.close()
+        self.addCleanup(os.remove, names_file.name)
+
+        result = self.basketball_stats.bulk_import_file(
+            names_file.name, rate=1000, batch_size=1, base_url=self.base_url, backoff=0.01)
+
+        self.assertEqual(sorted(result['added']), ["LeBron James", "Stephen Curry"])
+        self.assertEqual(sorted(result['failed']), ["Mike James", "Nobody Real"])
+        points = self.basketball_stats.connection.execute(
+            "SELECT Points FROM stats WHERE Name = 'Stephen Curry' ORDER BY id").fetchall()
+        self.assertEqual(points, [(24.6,), (24.8,)])
+        self.assertAlmostEqual(
+            self.basketball_stats.get_average('points'),
+            self.basketball_stats.connection.execute('SELECT AVG(Points) FROM stats').fetchone()[0])
+        # Three of the names are under 'j', but its letter page was downloaded once
+        self.assertEqual(StubBBRefHandler.requested.count('/players/j/'), 1)
+
+
+class TestExtraction(unittest.TestCase):
+    def setUp(self):
+        self.parsers = ['html.parser'] + (['lxml'] if lxml_etree is not None else [])
+        self.page = read_fixture('jamesle01.html')
+
+    def parse(self, page):
+        # Every parser has to agree
+        results = [parse_player_page(page, parser) for parser in self.parsers]
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+        return results[0]
+
+    def test_reads_career_stats_by_label(self):
+        self.assertEqual(self.parse(self.page), {'Name': "LeBron James", 'Points': 27.1, 'Rebounds': 7.5,
+                                                 'Assists': 7.4, 'FG_percent': 50.6, 'ThreePT_percent': 34.9})
+        self.assertEqual(self.parse(read_fixture('curryst01.html'))['ThreePT_percent'], 42.6)
+
+    def test_layout_changes_do_not_shift_stats(self):
+        # An extra bio paragraph and reordered cells would break reading by position
+        page = self.page.replace('<p>(King James, The Chosen One)</p>', '<p>(King James)</p><p>Pronunciation</p>')
+        ast = '<div><span class="poptip" data-tip="Assists"><strong>AST</strong></span><p>8.3</p><p>7.4</p></div>'
+        page = page.replace(ast, '').replace('<div class="p2">', '<div class="p2">' + ast)
+        self.assertEqual(self.parse(page), self.parse(self.page))
+
+    def test_missing_and_bad_values(self):
+        page = self.page.replace('<p>41.0</p><p>34.9</p>', '<p>41.0</p><p></p>')
+        self.assertIsNone(self.parse(page)['ThreePT_percent'])
+        # A rookie's page has only the season column
+        page = self.page.replace('<p>2023-24</p><p>Career</p>', '<p>2023-24</p>').replace('<p>25.7</p><p>27.1</p>',
+                                                                                            '<p>25.7</p>')
+        self.assertEqual(self.parse(page)['Points'], 25.7)
+        for parser in self.parsers:
+            with self.assertRaises(ValueError):
+                parse_player_page(self.page.replace('<p>27.1</p>', '<p>271</p>'), parser)
+            with self.assertRaises(ValueError):
+                parse_player_page(self.page.replace('stats_pullout', 'ad_block'), parser)
+            with self.assertRaises(ValueError):
+                parse_player_page("<html><body><p>Page not found</p></body></html>", parser)
+
+
+class TestPlayerURLIndex(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.session = FakeSession(fixture_pages())
+        self.cache = HTTPCache(self.cache_dir.name, session=self.session)
+        self.index_path = os.path.join(self.cache_dir.name, 'index.json')
+
+    def test_lookup_resolves_duplicates_and_accents(self):
+        index = PlayerURLIndex(normalize_name, self.cache, self.index_path)
+        self.assertEqual(index.lookup("lebron james"), [("LeBron James", f'{BBREF_URL}/players/j/jamesle01.html')])
+        self.assertEqual([url[-14:] for _, url in index.lookup("Mike James")],
+                         ['jamesmi01.html', 'jamesmi02.html'])
+        self.assertEqual(index.lookup("Nikola Jokic")[0][0], "Nikola Jokić")
+        self.assertEqual(index.lookup("Michael Jordan")[0][1], f'{BBREF_URL}/players/j/jordami01.html')
+        self.assertEqual(index.lookup("Nobody Jones"), [])
+        # Every lookup under 'j' was answered from a single download of the letter page
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_letter_downloads_are_rate_limited_and_shared(self):
+        # Concurrent lookups under one letter wait for a single, rate limited download
+        index = PlayerURLIndex(normalize_name, self.cache, self.index_path)
+        limiter = mock.Mock()
+        threads = [threading.Thread(target=index.lookup, args=(name, limiter))
+                   for name in ["LeBron James", "Mike James", "Michael Jordan", "Nikola Jokic"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.session.calls), 1)
+        limiter.wait.assert_called_once_with(f'{BBREF_URL}/players/j/')
+
+    def test_index_is_saved_and_refreshed_when_stale(self):
+        index = PlayerURLIndex(normalize_name, self.cache, self.index_path)
+        index.lookup("Stephen Curry")
+
+        reloaded = PlayerURLIndex(normalize_name, self.cache, self.index_path)
+        self.assertEqual(len(reloaded.lookup("Seth Curry")), 1)
+        self.assertEqual(len(self.session.calls), 1)
+
+        reloaded.max_age = 0
+        self.cache.ttl = 0
+        reloaded.refresh()
+        self.assertEqual(len(reloaded.lookup("Stephen Curry")), 1)
+        self.assertIn('If-None-Match', self.session.calls[-1][1])
+
+
+class TestHTTPCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.session = FakeSession(fixture_pages())
+        self.url = f'{BBREF_URL}/players/j/jamesle01.html'
+
+    def test_fresh_pages_skip_the_network(self):
+        cache = HTTPCache(self.cache_dir.name, session=self.session)
+        first = cache.get(self.url)
+        second = cache.get(self.url)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.session.calls), 1)
+        self.assertEqual((cache.misses, cache.hits), (1, 1))
+
+    def test_stale_pages_are_revalidated(self):
+        cache = HTTPCache(self.cache_dir.name, ttl=0, session=self.session)
+        body = cache.get(self.url)
+        self.assertEqual(cache.get(self.url), body)
+        self.assertIn('If-None-Match', self.session.calls[1][1])
+        self.assertEqual(cache.revalidations, 1)
+
+    def test_least_recently_used_pages_are_evicted(self):
+        page_size = len(read_fixture('jamesle01.html').encode('utf-8'))
+        cache = HTTPCache(self.cache_dir.name, max_bytes=page_size + 10, session=self.session)
+        cache.get(self.url)
+        cache.get(f'{BBREF_URL}/players/')
+        self.assertEqual(cache.read(self.url), (None, None))
+        self.assertIsNotNone(cache.read(f'{BBREF_URL}/players/')[0])
+
+    def test_page_evicted_during_a_hit_is_fetched_again(self):
+        cache = HTTPCache(self.cache_dir.name, session=self.session)
+        cache.get(self.url)
+        read = cache.read
+
+        def read_then_evict(url):
+            # Another thread evicts the page between reading it and marking it used
+            result = read(url)
+            cache.clear()
+            return result
+
+        with mock.patch.object(cache, 'read', side_effect=read_then_evict):
+            self.assertEqual(cache.get(self.url), read_fixture('jamesle01.html'))
+        self.assertEqual((cache.misses, cache.hits), (2, 0))
+        self.assertIsNotNone(cache.read(self.url)[0])
+
+    def test_errors_are_not_cached(self):
+        cache = HTTPCache(self.cache_dir.name, session=self.session)
+        with self.assertRaises(requests.HTTPError):
+            cache.get(f'{BBREF_URL}/players/z/nobody01.html')
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,265 @@
+"""
+Column-store engine for basketball stats, backed by NumPy arrays.
+
+ColumnStore answers the same read queries as BasketballStats (get_player_stat,
+get_average, get_high_low, filter_players, summarize, leaderboard, top_n,
+percentile_rank) with vectorized NumPy operations instead of SQL, so the two can be
+swapped and benchmarked against each other.
+"""
+
+import csv
+import sys
+
+import numpy
+
+from finalproposal import (CSV_FIELDS, DEFAULT_PERCENTILES, GROUP_COLUMNS, LOAD_BATCH_SIZE, STAT_COLUMNS,
+                           file_format, read_columnar_batches, resolve_percentiles, resolve_stat, stat_key)
+
+
+def parse_value(text):
+    """Convert a CSV field to a float, or None if it is missing or not a number."""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_python(value):
+    """Turn a NumPy scalar into the matching Python number."""
+    return value.item() if isinstance(value, numpy.generic) else value
+
+
+class ColumnStore:
+    """In-memory engine keeping each stat in a contiguous float64 array.
+
+    Player names are interned and kept in one object array. Missing values (such as 'NA'
+    in the CSV) are tracked in a validity mask per column instead of being stored as 0.0,
+    and are skipped by every aggregate.
+    """
+
+    def __init__(self, filename=None, capacity=1024):
+        """Create an empty store, loading a file in the basketball_data.csv layout if given."""
+        self.size = 0
+        self.names = numpy.empty(capacity, dtype=object)
+        self.values = {column: numpy.full(capacity, numpy.nan) for column in STAT_COLUMNS}
+        self.valid = {column: numpy.zeros(capacity, dtype=bool) for column in STAT_COLUMNS}
+        self.rows_by_name = {}
+        if filename is not None:
+            self.load_data(filename)
+
+    def reserve(self, extra):
+        """Make room for extra more rows, doubling the arrays as needed."""
+        needed = self.size + extra
+        capacity = len(self.names)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        names = numpy.empty(capacity, dtype=object)
+        names[:self.size] = self.names[:self.size]
+        self.names = names
+        for column in STAT_COLUMNS:
+            values = numpy.full(capacity, numpy.nan)
+            values[:self.size] = self.values[column][:self.size]
+            self.values[column] = values
+            valid = numpy.zeros(capacity, dtype=bool)
+            valid[:self.size] = self.valid[column][:self.size]
+            self.valid[column] = valid
+
+    def append_rows(self, names, columns):
+        """Append rows given as a list of names and {column: list of floats or None}."""
+        values = {}
+        valid = {}
+        for column in STAT_COLUMNS:
+            raw = columns[column]
+            valid[column] = numpy.array([value is not None for value in raw], dtype=bool)
+            values[column] = numpy.array([numpy.nan if value is None else value for value in raw], dtype=float)
+        self.append_arrays(names, values, valid)
+
+    def append_arrays(self, names, values, valid):
+        """Append rows given as a list of names and {column: float64 array} plus {column: bool array}."""
+        count = len(names)
+        self.reserve(count)
+        start, end = self.size, self.size + count
+        for offset, name in enumerate(names):
+            name = sys.intern(name)
+            self.names[start + offset] = name
+            self.rows_by_name.setdefault(name, []).append(start + offset)
+        for column in STAT_COLUMNS:
+            self.values[column][start:end] = values[column]
+            self.valid[column][start:end] = valid[column]
+        self.size = end
+
+    def load_columnar(self, filename, batch_size=LOAD_BATCH_SIZE):
+        """Load a Parquet or Arrow file; returns the number of rows loaded.
+
+        Stat columns without nulls are viewed as NumPy arrays without conversion, so each
+        batch costs one copy into the store.
+        """
+        total = 0
+        for batch in read_columnar_batches(filename, batch_size):
+            values = {}
+            valid = {}
+            for column, field in CSV_FIELDS.items():
+                array = batch.column(field)
+                values[column] = array.to_numpy(zero_copy_only=False)
+                valid[column] = (numpy.ones(len(array), dtype=bool) if array.null_count == 0
+                                 else array.is_valid().to_numpy(zero_copy_only=False))
+            self.append_arrays(batch.column('Name').to_pylist(), values, valid)
+            total += batch.num_rows
+        return total
+
+    def load_data(self, filename, batch_size=LOAD_BATCH_SIZE):
+        """Load a CSV, Parquet or Arrow file in batches; returns the number of rows loaded."""
+        if file_format(filename) != 'csv':
+            return self.load_columnar(filename, batch_size)
+        total = 0
+        with open(filename, mode='r', newline='') as file:
+            reader = csv.DictReader(file)
+            while True:
+                batch = [row for _, row in zip(range(batch_size), reader)]
+                if not batch:
+                    break
+                self.append_rows([row['Name'] for row in batch],
+                                 {column: [parse_value(row[field]) for row in batch]
+                                  for column, field in CSV_FIELDS.items()})
+                total += len(batch)
+        return total
+
+    def insert_players(self, players):
+        """Insert players given as dicts with Name and the stats columns."""
+        self.append_rows([player['Name'] for player in players],
+                         {column: [player.get(column) for player in players] for column in STAT_COLUMNS})
+
+    def column(self, stat):
+        """Return (values, validity mask) for a stat, trimmed to the rows in use."""
+        column = resolve_stat(stat)
+        return self.values[column][:self.size], self.valid[column][:self.size]
+
+    def get_player_stat(self, player_name, stat):
+        """Return one stat for a player; raise KeyError if the player is not in the store."""
+        rows = self.rows_by_name.get(player_name)
+        if not rows:
+            raise KeyError(player_name)
+        values, valid = self.column(stat)
+        return float(values[rows[0]]) if valid[rows[0]] else None
+
+    def get_average(self, stat):
+        """Return the average of a stat across all players, ignoring missing values."""
+        values, valid = self.column(stat)
+        present = values[valid]
+        return float(present.mean()) if present.size else None
+
+    def get_high_low(self, stat):
+        """Return (high value, names with it, low value, names with it) for a stat."""
+        values, valid = self.column(stat)
+        present = values[valid]
+        if not present.size:
+            return None, [], None, []
+        high, low = present.max(), present.min()
+        high_names = sorted(self.names[:self.size][valid & (values == high)])
+        low_names = sorted(self.names[:self.size][valid & (values == low)])
+        return float(high), high_names, float(low), low_names
+
+    def filter_players(self, stat, min_value=None, max_value=None):
+        """Return (Name, value) for every player whose stat lies within [min_value, max_value]."""
+        values, valid = self.column(stat)
+        mask = valid.copy()
+        if min_value is not None:
+            mask &= values >= min_value
+        if max_value is not None:
+            mask &= values <= max_value
+        rows = numpy.flatnonzero(mask)
+        # Highest value first, ties in insertion order, like the SQLite engine
+        rows = rows[numpy.lexsort((rows, -values[rows]))]
+        return [(self.names[row], float(values[row])) for row in rows]
+
+    def leaderboard(self, stat, n=10, bottom=False):
+        """Return the top (or bottom) n players for a stat with their rank and dense rank.
+
+        numpy.argpartition-style selection picks the n rows in O(n) and only those rows
+        are sorted, so there is no sort of the whole column.
+        """
+        values, valid = self.column(stat)
+        rows = numpy.flatnonzero(valid)
+        keys = values[rows] if bottom else -values[rows]
+        if n <= 0 or not rows.size:
+            return []
+        if n < rows.size:
+            cutoff = numpy.partition(keys, n - 1)[n - 1]
+            better = rows[keys < cutoff]
+            # Players tied at the cut-off are taken in name order, like the SQLite engine
+            tied = sorted(rows[keys == cutoff], key=lambda row: self.names[row])
+            rows = numpy.concatenate([better, numpy.array(tied[:n - better.size], dtype=better.dtype)])
+            keys = values[rows] if bottom else -values[rows]
+
+        order = sorted(range(rows.size), key=lambda i: (keys[i], self.names[rows[i]]))
+        entries = []
+        for position, i in enumerate(order):
+            if position and keys[i] == keys[order[position - 1]]:
+                rank, dense_rank = entries[-1]['rank'], entries[-1]['dense_rank']
+            else:
+                rank = position + 1
+                dense_rank = entries[-1]['dense_rank'] + 1 if entries else 1
+            entries.append({'rank': rank, 'dense_rank': dense_rank, 'name': self.names[rows[i]],
+                            'value': float(values[rows[i]])})
+        return entries
+
+    def top_n(self, stat, n=10, ascending=False):
+        """Return the n (Name, value) pairs with the highest stat, or the lowest if ascending."""
+        return [(entry['name'], entry['value']) for entry in self.leaderboard(stat, n, bottom=ascending)]
+
+    def percentile_rank(self, player_name, stat):
+        """Return where a player stands for a stat: rank, dense rank and percentile (0-100)."""
+        value = self.get_player_stat(player_name, stat)
+        if value is None:
+            raise KeyError(player_name)
+        values, valid = self.column(stat)
+        present = values[valid]
+        above = present[present > value]
+        below = int(numpy.count_nonzero(present < value))
+        return {
+            'name': player_name,
+            'value': value,
+            'rank': int(above.size) + 1,
+            'dense_rank': int(numpy.unique(above).size) + 1,
+            'percentile': 100.0 * below / (present.size - 1) if present.size > 1 else 100.0
+        }
+
+    def describe(self, values, percentiles):
+        """Compute the summarize() entry for one array of present values."""
+        entry = {
+            'count': int(values.size),
+            'mean': float(values.mean()) if values.size else None,
+            'min': float(values.min()) if values.size else None,
+            'max': float(values.max()) if values.size else None,
+            'stddev': float(values.std(ddof=1)) if values.size > 1 else None
+        }
+        if percentiles:
+            results = numpy.percentile(values, percentiles) if values.size else [None] * len(percentiles)
+            for percentile, value in zip(percentiles, results):
+                entry[f'p{percentile:g}'] = to_python(value)
+        return entry
+
+    def summarize(self, stats=None, group_by=None, percentiles=DEFAULT_PERCENTILES):
+        """Compute count, mean, min, max, stddev and percentiles for several stats at once.
+
+        Returns the same structure as BasketballStats.summarize.
+        """
+        columns = [resolve_stat(stat) for stat in (stats or STAT_COLUMNS)]
+        percentiles = resolve_percentiles(percentiles)
+        if group_by is not None and str(group_by).lower() not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by '{group_by}'. Choose from: {', '.join(GROUP_COLUMNS)}.")
+
+        if group_by is None:
+            return {stat_key(column): self.describe(self.values[column][:self.size][self.valid[column][:self.size]],
+                                                    percentiles)
+                    for column in columns}
+
+        results = {}
+        for name, rows in sorted(self.rows_by_name.items()):
+            rows = numpy.array(rows)
+            results[name] = {stat_key(column): self.describe(self.values[column][rows][self.valid[column][rows]],
+                                                             percentiles)
+                             for column in columns}
+        return results
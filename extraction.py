@@ -0,0 +1,132 @@
+"""
+Reading the player name and career stats out of a Basketball Reference player page.
+
+The stats come from the summary block at the top of the page (div.stats_pullout) and
+are picked by their labels (PTS, TRB, ...), so extra or missing paragraphs elsewhere on
+the page do not shift them. lxml is used when it is installed, BeautifulSoup otherwise.
+"""
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+try:
+    from bs4.filter import ElementFilter
+except ImportError:
+    ElementFilter = None  # BeautifulSoup before 4.13 parses the whole page
+
+STAT_LABELS = {
+    'PTS': 'Points',
+    'TRB': 'Rebounds',
+    'AST': 'Assists',
+    'FG%': 'FG_percent',
+    'FG3%': 'ThreePT_percent'
+}  # Label in the summary block -> stats column
+SUMMARY_LABEL = 'SUMMARY'  # Label of the header cell naming the columns (season, Career)
+CAREER_LABEL = 'Career'
+PULLOUT_CLASS = 'stats_pullout'
+LXML_CHUNK_SIZE = 16 * 1024  # Characters fed to the lxml pull parser at a time
+
+
+def parse_number(text):
+    """Turn '34.9', '.349' or '1,492' into a float; return None for a blank or non-numeric cell."""
+    try:
+        return float(text.replace('%', '').replace(',', ''))
+    except ValueError:
+        return None
+
+
+def career_stats(name, cells):
+    """Build the stats dict from the summary block, given as {label: [cell texts]}.
+
+    Raises ValueError when a value is impossible (above 100).
+    """
+    header = cells.get(SUMMARY_LABEL, [])
+    # The last column is the career one when the header is missing (older layouts)
+    column = header.index(CAREER_LABEL) if CAREER_LABEL in header else -1
+    stats = {'Name': name}
+    for label, key in STAT_LABELS.items():
+        values = cells.get(label, [])
+        stats[key] = parse_number(values[column]) if values and column < len(values) else None
+    if any(value is not None and value > 100 for key, value in stats.items() if key != 'Name'):
+        raise ValueError("Data is formatted incorrectly in website. Unable to continue.")
+    return stats
+
+
+if ElementFilter is not None:
+    class HeadingAndPullout(ElementFilter):
+        """Keeps only the h1 and the stats summary block while BeautifulSoup parses."""
+
+        def allow_tag_creation(self, nsprefix, name, attrs):
+            if name == 'h1':
+                return True
+            return name == 'div' and PULLOUT_CLASS in (attrs or {}).get('class', '').split()
+
+        def allow_string_creation(self, string):
+            return False
+
+
+def parse_with_soup(page):
+    """Return (name, cells) using BeautifulSoup's html.parser."""
+    parse_only = HeadingAndPullout() if ElementFilter is not None else None
+    soup = BeautifulSoup(page, 'html.parser', parse_only=parse_only)
+    heading = soup.find('h1')
+    pullout = soup.find('div', class_=PULLOUT_CLASS)
+    if heading is None:
+        raise ValueError("Page has no player name.")
+    if pullout is None:
+        raise ValueError("Page has no career stats summary.")
+    cells = {}
+    for label in pullout.find_all('strong'):
+        cell = label.find_parent('div')
+        cells[label.get_text(strip=True)] = [p.get_text(strip=True) for p in cell.find_all('p', recursive=False)]
+    return heading.get_text(strip=True), cells
+
+
+def parse_with_lxml(page, chunk_size=LXML_CHUNK_SIZE):
+    """Return (name, cells) using lxml.
+
+    The page is fed to a pull parser in chunks and parsing stops as soon as the summary
+    block has been read, so the large tables further down are never parsed.
+    """
+    parser = lxml_etree.HTMLPullParser(events=('end',), tag=('h1', 'div'))
+    heading = pullout = None
+    for start in range(0, len(page), chunk_size):
+        parser.feed(page[start:start + chunk_size])
+        for _, element in parser.read_events():
+            if element.tag == 'h1' and heading is None:
+                heading = ''.join(element.itertext())
+            elif element.tag == 'div' and PULLOUT_CLASS in (element.get('class') or '').split():
+                pullout = element
+                break
+        if pullout is not None:
+            break
+    if heading is None:
+        raise ValueError("Page has no player name.")
+    if pullout is None:
+        raise ValueError("Page has no career stats summary.")
+    cells = {}
+    for label in pullout.iter('strong'):
+        cell = next(parent for parent in label.iterancestors() if parent.tag == 'div')
+        cells[''.join(label.itertext()).strip()] = [''.join(p.itertext()).strip() for p in cell.findall('p')]
+    return heading.strip(), cells
+
+
+def parse_player_page(page, parser=None):
+    """Read the name and career stats from a player page in a single parse.
+
+    Returns a dict with Name and the five stats columns; a stat missing from the page is
+    None. parser is 'lxml' or 'html.parser' (lxml when installed, by default). Raises
+    ValueError when the page does not have the expected layout.
+    """
+    if parser is None:
+        parser = 'lxml' if lxml_etree is not None else 'html.parser'
+    if parser == 'lxml':
+        if lxml_etree is None:
+            raise ImportError("The lxml parser needs lxml (pip install lxml).")
+        name, cells = parse_with_lxml(page)
+    else:
+        name, cells = parse_with_soup(page)
+    return career_stats(name, cells)
@@ -4,59 +4,927 @@ Directory ID: spatil11@terpmail.umd.edu
 Exercise: Final Proposals
 """
 
+import argparse
+import contextlib
 import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import shlex
 import sqlite3
-import requests
-from bs4 import BeautifulSoup
+import sys
+import time
+import threading
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pool import ConnectionPool, memory_uri
+from profiler import SLOW_QUERY_SECONDS, ProfiledConnection, slow_query_log
+from scraper import (BBREF_URL, INDEX_FILE, REQUESTS_PER_SECOND, RETRY_BACKOFF, HTTPCache, PlayerURLIndex,
+                     RateLimiter, fetch_with_retries)
+
+LOAD_BATCH_SIZE = 10000  # Rows inserted per transaction when streaming the CSV
+BULK_CACHE_KIB = 64000  # Page cache used while bulk loading (64 MB)
+SCHEMA_VERSION = 5  # Bump whenever the layout of the stats table changes
+STAT_COLUMNS = ['Points', 'Assists', 'Rebounds', 'FG_percent', 'ThreePT_percent']
+STAT_KEYS = {
+    'points': 'Points',
+    'assists': 'Assists',
+    'rebounds': 'Rebounds',
+    'fg%': 'FG_percent',
+    '3pt%': 'ThreePT_percent'
+}
+CSV_FIELDS = {
+    'Points': 'Points',
+    'Assists': 'Assists',
+    'Rebounds': 'Rebounds',
+    'FG_percent': 'FG%',
+    'ThreePT_percent': '3PT%'
+}
+STAT_OPTIONS = {
+    'points': '--points',
+    'assists': '--assists',
+    'rebounds': '--rebounds',
+    'fg%': '--fg-percent',
+    '3pt%': '--three-percent'
+}  # Command line options for setting each stat
+GAME_LOG_FIELDS = {
+    'Player': 'player',
+    'Season': 'season',
+    'Team': 'team',
+    'Date': 'date',
+    'PTS': 'points',
+    'AST': 'assists',
+    'TRB': 'rebounds',
+    'FGM': 'fgm',
+    'FGA': 'fga',
+    '3PM': 'tpm',
+    '3PA': 'tpa'
+}  # Game log CSV header -> add_game_logs key
+SEASON_STAT_SQL = {
+    'Points': 'SUM(points) / SUM(games)',
+    'Assists': 'SUM(assists) / SUM(games)',
+    'Rebounds': 'SUM(rebounds) / SUM(games)',
+    'FG_percent': '100.0 * SUM(fgm) / NULLIF(SUM(fga), 0)',
+    'ThreePT_percent': '100.0 * SUM(tpm) / NULLIF(SUM(tpa), 0)'
+}  # Per-game averages computed from season_totals rows
+DISPLAY_BATCH_SIZE = 500  # Rows fetched from the cursor per batch when listing players
+DISPLAY_PAGE_SIZE = 25  # Players shown per page in the interactive menu
+GROUP_COLUMNS = {'name': 'Name'}  # Columns summarize() may group by
+DEFAULT_PERCENTILES = (25, 50, 75)
+IMPORT_WORKERS = 8  # Threads fetching player pages during a bulk import
+IMPORT_BATCH_SIZE = 100  # Imported players inserted per transaction
+SEARCH_CANDIDATES = 200  # Candidates pulled from the name index before re-ranking
+COLUMNAR_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}  # File extension -> format
+EXPORT_FORMATS = ['csv', 'jsonl', 'parquet', 'arrow']
+NAME_TRIGGERS = ['stats_name_insert', 'stats_name_delete', 'stats_name_update']
+
+
+def normalize_name(name):
+    """Lowercase a name and strip accents so that 'Jokić' and 'jokic' compare equal."""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+
+def name_trigrams(name):
+    """Return the set of three-character substrings of a normalized name."""
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+def name_segments(name):
+    """Split each word of a normalized name into halves of at least three characters.
+
+    A single typo can only spoil one half of a word, so searching for the halves still
+    finds the intended name.
+    """
+    segments = []
+    for word in name.split():
+        if len(word) >= 6:
+            segments += [word[:len(word) // 2], word[len(word) // 2:]]
+        elif len(word) >= 3:
+            segments.append(word)
+    return segments
+
+
+def resolve_stat(stat):
+    """Return the stats column for a stat given as 'fg%' or 'FG_percent'; raise ValueError if unknown."""
+    key = str(stat).strip().lower()
+    if key in STAT_KEYS:
+        return STAT_KEYS[key]
+    for column in STAT_COLUMNS:
+        if key == column.lower():
+            return column
+    raise ValueError(f"Unknown stat '{stat}'. Choose from: {', '.join(STAT_KEYS)}.")
+
+
+def stat_key(column):
+    """Return the user-friendly name ('fg%') for a stats column ('FG_percent')."""
+    return next(key for key, value in STAT_KEYS.items() if value == column)
+
+
+def resolve_percentiles(percentiles):
+    """Return percentiles as a tuple of numbers; raise ValueError if one is not between 0 and 100."""
+    resolved = []
+    for percentile in percentiles or ():
+        try:
+            value = float(percentile)
+        except (TypeError, ValueError):
+            raise ValueError(f"Percentile '{percentile}' is not a number.") from None
+        if not 0 <= value <= 100:
+            raise ValueError(f"Percentile {percentile} is out of range. Choose values from 0 to 100.")
+        resolved.append(value)
+    return tuple(resolved)
+
+
+def file_format(path):
+    """Return 'parquet' or 'arrow' for a columnar file, judged by its extension, and 'csv' otherwise."""
+    return COLUMNAR_FORMATS.get(os.path.splitext(str(path))[1].lower(), 'csv')
+
+
+def import_pyarrow():
+    """Import pyarrow, which is only needed for Parquet and Arrow files."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError("Parquet and Arrow files need pyarrow (pip install pyarrow).") from error
+    return pyarrow
+
+
+def columnar_schema(fields):
+    """Return the Arrow schema for Name followed by the given stat fields (float64, nullable)."""
+    pyarrow = import_pyarrow()
+    return pyarrow.schema([('Name', pyarrow.string())] + [(field, pyarrow.float64()) for field in fields])
+
+
+def read_columnar_batches(path, batch_size=LOAD_BATCH_SIZE):
+    """Yield Arrow record batches of Name and the five stats (basketball_data.csv headers) from a file.
+
+    Arrow files are memory-mapped and their batches are sliced without copying; Parquet
+    pages are decoded one batch at a time. Missing values stay null.
+    """
+    pyarrow = import_pyarrow()
+    schema = columnar_schema(CSV_FIELDS.values())
+    if file_format(path) == 'parquet':
+        batches = pyarrow.parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size, columns=schema.names)
+    else:
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(path))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    for batch in batches:
+        batch = batch.select(schema.names)
+        if batch.schema != schema:
+            batch = batch.cast(schema)
+        for start in range(0, batch.num_rows, batch_size):
+            yield batch.slice(start, batch_size)
+
+
+def write_columnar(destination, fmt, fields, rows, batch_size=LOAD_BATCH_SIZE):
+    """Write (Name, stat, ...) rows to a Parquet or Arrow file in batches; returns the rows written."""
+    pyarrow = import_pyarrow()
+    schema = columnar_schema(fields)
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(destination, schema)
+    else:
+        writer = pyarrow.ipc.new_file(destination, schema)
+    count = 0
+    with writer:
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            columns = list(zip(*batch))
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+            count += len(batch)
+    return count
+
+
+class StddevAggregate:
+    """SQLite aggregate for the sample standard deviation, computed in one pass (Welford)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        if self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class PercentilesAggregate:
+    """SQLite aggregate returning several percentiles of a column as a JSON list.
+
+    The second argument is a comma separated list such as '25,50,75'. Values between
+    ranks are linearly interpolated, matching numpy.percentile's default.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.percentiles = ()
+
+    def step(self, value, percentiles):
+        if not self.percentiles:
+            self.percentiles = [float(p) for p in percentiles.split(',') if p]
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return json.dumps([None] * len(self.percentiles))
+        self.values.sort()
+        last = len(self.values) - 1
+        results = []
+        for percentile in self.percentiles:
+            position = last * percentile / 100
+            low = math.floor(position)
+            high = min(low + 1, last)
+            fraction = position - low
+            results.append(self.values[low] + (self.values[high] - self.values[low]) * fraction)
+        return json.dumps(results)
+
+
+class StatAggregates:
+    """Running count and sum for each stat column.
+
+    A column is built from the table the first time it is read and then kept up to date
+    by add/remove/update, so averages never re-scan the table. Highs and lows are read
+    from the stat indexes instead (see BasketballStats.get_high_low).
+    """
+
+    def __init__(self, loader):
+        self.loader = loader  # Function returning every value of a column
+        self.columns = {}
+        self.lock = threading.RLock()  # Held by readers of the cache and by writers of the table
+
+    def state(self, column):
+        """Return the running state for a column, building it on first use."""
+        with self.lock:
+            if column not in self.columns:
+                values = [value for value in self.loader(column) if value is not None]
+                self.columns[column] = {'count': len(values), 'total': math.fsum(values)}
+            return self.columns[column]
+
+    def push(self, state, value):
+        if value is None:
+            return
+        state['count'] += 1
+        state['total'] += value
+
+    def pop(self, state, value):
+        if value is None or not state['count']:
+            return
+        state['count'] -= 1
+        state['total'] -= value
+        if not state['count']:
+            state['total'] = 0.0  # Clear any rounding error left from the removals
+
+    def add(self, row):
+        """Record an inserted row, given as {column: value}."""
+        with self.lock:
+            for column, value in row.items():
+                if column in self.columns:
+                    self.push(self.columns[column], value)
+
+    def remove(self, row):
+        """Record a deleted row, given as {column: value}."""
+        with self.lock:
+            for column, value in row.items():
+                if column in self.columns:
+                    self.pop(self.columns[column], value)
+
+    def update(self, old_row, new_row):
+        """Record an edited row; only the columns whose value changed are touched."""
+        with self.lock:
+            for column, value in new_row.items():
+                if column in self.columns and old_row.get(column) != value:
+                    self.pop(self.columns[column], old_row.get(column))
+                    self.push(self.columns[column], value)
+
+    def invalidate(self, column=None):
+        """Forget one column (or all of them) so it is rebuilt on the next read."""
+        with self.lock:
+            if column is None:
+                self.columns.clear()
+            else:
+                self.columns.pop(column, None)
+
+    def average(self, column):
+        with self.lock:
+            state = self.state(column)
+            return state['total'] / state['count'] if state['count'] else None
+
+
+def row_values(row):
+    """Turn a (Name, stat, ..., origin) change log row into {column: value} for the aggregate cache."""
+    return dict(zip(STAT_COLUMNS, row[1:])) if row else {}
+
+
+def apply_changes(connection, changes):
+    """Apply (op, row_id, before, after) change log entries to the stats table of a connection.
+
+    before and after are [Name, stat, ..., origin] lists (or JSON text of them). Rows are
+    matched by id, so the same entries can be replayed on a copy of the database.
+    """
+    columns = ', '.join(['Name'] + [f'"{column}"' for column in STAT_COLUMNS] + ['origin'])
+    assignments = ', '.join(['Name = ?'] + [f'"{column}" = ?' for column in STAT_COLUMNS] + ['origin = ?'])
+    placeholders = ', '.join('?' * (len(STAT_COLUMNS) + 3))
+    count = 0
+    for op, row_id, before, after in changes:
+        after = json.loads(after) if isinstance(after, str) else after
+        if op == 'insert':
+            connection.execute(f'INSERT INTO stats (id, {columns}) VALUES ({placeholders})', (row_id, *after))
+        elif op == 'update':
+            connection.execute(f'UPDATE stats SET {assignments} WHERE id = ?', (*after, row_id))
+        else:
+            connection.execute('DELETE FROM stats WHERE id = ?', (row_id,))
+        count += 1
+    return count
+
+
+def create_name_triggers(connection):
+    """Create the TEMP triggers that mirror player names into name_search on one connection.
+
+    The triggers call the Python normalize_name function, so they only live as long as the
+    connection; kept in the database file they would break writes from any other SQLite client.
+    """
+    for trigger in NAME_TRIGGERS:
+        connection.execute(f'DROP TRIGGER IF EXISTS main.{trigger}')  # Saved in the file by older versions
+    connection.execute('''
+        CREATE TEMP TRIGGER IF NOT EXISTS stats_name_insert AFTER INSERT ON main.stats BEGIN
+            INSERT INTO name_search (rowid, norm_name) VALUES (NEW.id, normalize_name(NEW.Name));
+        END
+    ''')
+    connection.execute('''
+        CREATE TEMP TRIGGER IF NOT EXISTS stats_name_delete AFTER DELETE ON main.stats BEGIN
+            DELETE FROM name_search WHERE rowid = OLD.id;
+        END
+    ''')
+    connection.execute('''
+        CREATE TEMP TRIGGER IF NOT EXISTS stats_name_update AFTER UPDATE OF Name ON main.stats BEGIN
+            UPDATE name_search SET norm_name = normalize_name(NEW.Name) WHERE rowid = NEW.id;
+        END
+    ''')
+
+
+class StatsBatch:
+    """Inserts, updates and deletes applied in one transaction and written to the change log.
+
+    Created by BasketballStats.batch(). Each change is logged as (op, row id, row before,
+    row after), which is enough to undo it, redo it, or replay it on a copy of the database.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.changes = []
+        self.savepoints = 0
+
+    def insert(self, name, stats=None):
+        """Add one player (stats maps stat names to values); returns the new row id."""
+        values = {resolve_stat(stat): value for stat, value in (stats or {}).items()}
+        row = [name] + [values.get(column) for column in STAT_COLUMNS] + ['user']
+        columns = ', '.join(['Name'] + [f'"{column}"' for column in STAT_COLUMNS] + ['origin'])
+        row_id = self.connection.execute(
+            f'INSERT INTO stats ({columns}) VALUES ({", ".join("?" * len(row))})', row).lastrowid
+        self.changes.append(('insert', row_id, None, row))
+        return row_id
+
+    def update(self, name, stats):
+        """Change some or all stats of every player with this exact name; returns the rows changed."""
+        values = {resolve_stat(stat): value for stat, value in stats.items()}
+        if not values:
+            return 0
+        rows = self.rows_named(name)
+        assignments = ', '.join(f'"{column}" = ?' for column in values)
+        self.connection.execute(f'UPDATE stats SET {assignments} WHERE Name = ?', (*values.values(), name))
+        for row_id, before in rows:
+            after = [name] + [values.get(column, value) for column, value in zip(STAT_COLUMNS, before[1:])]
+            after.append(before[-1])
+            self.changes.append(('update', row_id, before, after))
+        return len(rows)
+
+    def delete(self, name):
+        """Delete every player with this exact name; returns the rows deleted."""
+        rows = self.rows_named(name)
+        self.connection.execute('DELETE FROM stats WHERE Name = ?', (name,))
+        for row_id, before in rows:
+            self.changes.append(('delete', row_id, before, None))
+        return len(rows)
+
+    def rows_named(self, name):
+        """Return (id, [Name, stat, ..., origin]) for every player with this exact name."""
+        columns = ', '.join(f'"{column}"' for column in STAT_COLUMNS)
+        rows = self.connection.execute(f'SELECT id, Name, {columns}, origin FROM stats WHERE Name = ?', (name,))
+        return [(row[0], list(row[1:])) for row in rows]
+
+    @contextlib.contextmanager
+    def savepoint(self):
+        """Undo only the changes made inside the with block if it raises (the error is re-raised)."""
+        self.savepoints += 1
+        name = f'batch_savepoint_{self.savepoints}'
+        mark = len(self.changes)
+        self.connection.execute(f'SAVEPOINT {name}')
+        try:
+            yield self
+        except BaseException:
+            self.connection.execute(f'ROLLBACK TO {name}')
+            self.connection.execute(f'RELEASE {name}')
+            del self.changes[mark:]
+            raise
+        self.connection.execute(f'RELEASE {name}')
+
+
+def name_similarity(first, second):
+    """Score how alike two normalized names are, from 0.0 to 1.0 (trigram Jaccard index)."""
+    first_grams, second_grams = name_trigrams(first), name_trigrams(second)
+    if not first_grams or not second_grams:
+        return 1.0 if first == second else 0.0
+    return len(first_grams & second_grams) / len(first_grams | second_grams)
+
 
 class BasketballStats:
     """Class for managing basketball player statistics."""
     
-    def __init__(self, filename):
-        """Initialize the BasketballStats class with a CSV filename and set up the database."""
+    def __init__(self, filename, db_path=':memory:', slow_query_seconds=SLOW_QUERY_SECONDS, pool_size=0,
+                 lazy=False):
+        """Initialize the BasketballStats class with a CSV filename and set up the database.
+
+        Pass a file path as db_path to keep the database on disk between runs. The CSV is
+        only loaded again when it has changed since the last load. Statements slower than
+        slow_query_seconds are logged; see self.profiler for per-query statistics.
+
+        With pool_size above 0 the object can be shared between threads: queries run on up
+        to pool_size read-only connections in parallel and changes go through one writer.
+        With lazy=True the tables are set up and the CSV loaded on the first query instead.
+        """
         self.filename = filename
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.database_uri = memory_uri() if pool_size and not self.is_persistent() else None
         self.connection = self.create_database()
-        self.create_table()
-        self.load_data()
+        self.profiler = self.connection.profiler
+        self.profiler.slow_seconds = slow_query_seconds
+        self.pool = None
+        self.writer_thread = None  # Thread currently inside writing()
         self.valid_stats = ['points', 'assists', 'rebounds', 'fg%', '3pt%']
+        self.aggregates = StatAggregates(self.column_values)
+        self.http_cache = None  # Created on the first Basketball Reference lookup
+        self.player_index = None
+        self.last_load_stats = None  # Rows, seconds and rows/second of the last CSV load, if any
+        self.loaded = False
+        self.loading = False
+        if pool_size:
+            self.pool = ConnectionPool(self.database_uri or db_path, self.connection, pool_size,
+                                       configure=self.configure_reader)
+        if not lazy:
+            self.ensure_loaded()
+
+    def is_persistent(self):
+        """Return True if the database is stored in a file instead of memory."""
+        return self.db_path != ':memory:'
 
     def create_database(self):
-        """Create a database connection."""
-        conn = sqlite3.connect(':memory:')
+        """Create a database connection whose statements are all timed by a QueryProfiler."""
+        if self.database_uri:
+            conn = sqlite3.connect(self.database_uri, uri=True, check_same_thread=False, factory=ProfiledConnection)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=not self.pool_size, factory=ProfiledConnection)
+        self.register_functions(conn)
+        if self.is_persistent():
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
         return conn
 
+    def register_functions(self, conn):
+        """Add the SQL functions and aggregates used by the queries and triggers to a connection."""
+        # Needed by the triggers that keep the name search index in sync
+        conn.create_function('normalize_name', 1, normalize_name, deterministic=True)
+        conn.create_aggregate('stddev', 1, StddevAggregate)
+        conn.create_aggregate('percentiles', 2, PercentilesAggregate)
+
+    def configure_reader(self, conn):
+        """Set up a pooled reader connection like the main one, reporting to the same profiler."""
+        self.register_functions(conn)
+        conn.profiler = self.profiler
+        self.profiler.attach(conn)
+
+    def close(self):
+        """Close the database connection (and any pooled readers)."""
+        if self.pool is not None:
+            self.pool.close()
+        self.connection.close()
+
+    def ensure_loaded(self):
+        """Create the tables and load the CSV file, unless that has been done already."""
+        if self.loaded:
+            return
+        # The aggregate lock is the one writing() takes, so a load never waits on a writer
+        with self.aggregates.lock:
+            if self.loaded or self.loading:
+                return  # Loaded by another thread, or called again from inside the load
+            self.loading = True
+            try:
+                self.create_table()
+                if self.needs_reload():
+                    self.reload_data()
+                self.loaded = True
+            finally:
+                self.loading = False
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Yield a connection for queries: a pooled reader, or the main connection without a pool.
+
+        Inside writing() the main connection is used, so reads see the uncommitted changes.
+        """
+        self.ensure_loaded()
+        if self.pool is None or self.writer_thread == threading.get_ident():
+            yield self.connection
+        else:
+            with self.pool.read() as connection:
+                yield connection
+
+    @contextlib.contextmanager
+    def writing(self):
+        """Hold the only writer (and the aggregate cache) and commit the changes made in the block."""
+        self.ensure_loaded()
+        if self.writer_thread == threading.get_ident():
+            yield self.connection  # Already the writer; the outer block commits
+            return
+        with contextlib.ExitStack() as stack:
+            connection = self.connection
+            if self.pool is not None:
+                # The pool comes before the aggregate lock: a reader holds its side of the pool while
+                # it reads the cache, so a writer holding the cache while waiting for readers would deadlock
+                connection = stack.enter_context(self.pool.write())
+            stack.enter_context(self.aggregates.lock)
+            self.writer_thread = threading.get_ident()
+            try:
+                with connection:
+                    yield connection
+            except BaseException:
+                self.aggregates.invalidate()  # Nested edits may have counted changes that were rolled back
+                raise
+            finally:
+                self.writer_thread = None
+
+    def column_values(self, column):
+        """Yield every non-null value of a stat column (used to build the aggregate cache)."""
+        with self.reading() as connection:
+            for row in connection.execute(f'SELECT "{column}" FROM stats WHERE "{column}" IS NOT NULL'):
+                yield row[0]
+
+    def fetch_stat_rows(self, name):
+        """Return the stats of every player with this exact name as {column: value} dicts."""
+        columns = ', '.join(f'"{column}"' for column in STAT_COLUMNS)
+        with self.reading() as connection:
+            rows = connection.execute(f'SELECT {columns} FROM stats WHERE Name = ?', (name,)).fetchall()
+        return [dict(zip(STAT_COLUMNS, row)) for row in rows]
+
+    def get_schema_info(self, key):
+        """Return a value stored in the schema_info table, or None if it is missing."""
+        row = self.connection.execute('SELECT value FROM schema_info WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_schema_info(self, key, value):
+        """Store a value in the schema_info table."""
+        self.connection.execute(
+            'INSERT OR REPLACE INTO schema_info (key, value) VALUES (?, ?)', (key, str(value)))
+
     def create_table(self):
-        """Create the basketball stats table."""
+        """Create the basketball stats table, rebuilding it if the schema version changed."""
         with self.connection:
             self.connection.execute('''
-                CREATE TABLE stats (
+                CREATE TABLE IF NOT EXISTS schema_info (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            version = self.get_schema_info('schema_version')
+            migrated = version is not None and int(version) == 4
+            if migrated:
+                # Version 4 had no origin column; its rows without a player_id all came from the file
+                self.connection.execute("ALTER TABLE stats ADD COLUMN origin TEXT NOT NULL DEFAULT 'user'")
+                self.connection.execute("UPDATE stats SET origin = 'csv' WHERE player_id IS NULL")
+            elif version is not None and int(version) != SCHEMA_VERSION:
+                # Old layout: drop it and force the CSV to be loaded again
+                self.connection.execute('DROP TABLE IF EXISTS stats')
+                self.connection.execute('DROP TABLE IF EXISTS name_search')
+                self.connection.execute("DELETE FROM schema_info WHERE key LIKE 'source_%'")
+
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS stats (
+                    id INTEGER PRIMARY KEY,
                     Name TEXT,
                     Points REAL,
                     Assists REAL,
                     Rebounds REAL,
                     FG_percent REAL,
-                    ThreePT_percent REAL
+                    ThreePT_percent REAL,
+                    player_id INTEGER REFERENCES players (id),
+                    origin TEXT NOT NULL DEFAULT 'user'
                 )
             ''')
+            # origin is 'csv' for rows loaded from the source file; anything else is kept by a reload.
+            # Career lines computed from game logs are keyed by player; CSV rows have no player_id
+            self.connection.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS idx_stats_player ON stats (player_id) WHERE player_id IS NOT NULL')
+            self.create_season_tables()
+            self.connection.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS name_search
+                USING fts5(norm_name, tokenize = 'trigram')
+            ''')
+            self.create_change_log()
+            if migrated:
+                self.clear_change_log()  # Logged rows have no origin yet, so they cannot be replayed
+            self.set_schema_info('schema_version', SCHEMA_VERSION)
+        self.create_indexes()
 
-    def load_data(self):
-        """Load data from the CSV file into the database."""
-        with open(self.filename, mode='r') as file:
-            reader = csv.DictReader(file)
-            data = [(
-                row['Name'],
-                self.validate_float(row['Points']),
-                self.validate_float(row['Assists']),
-                self.validate_float(row['Rebounds']),
-                self.validate_float(row['FG%']),
-                self.validate_float(row['3PT%'])
-            ) for row in reader]
+    def create_change_log(self):
+        """Create the change_batches and change_log tables used for undo, redo and replication.
 
+        kind is 'edit' for a batch() and 'undo' or 'redo' for the entries those write; an
+        edit's status is 'done', 'undone' or 'discarded' (undone, then replaced by a new edit).
+        The log is only ever appended to, so replicas can replay it in id order.
+        """
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS change_batches (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                label TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                id INTEGER PRIMARY KEY,
+                batch_id INTEGER NOT NULL REFERENCES change_batches (id),
+                op TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                before TEXT,
+                after TEXT
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_change_log_batch ON change_log (batch_id)')
+        if self.get_schema_info('change_log_epoch') is None:
+            self.set_schema_info('change_log_epoch', uuid.uuid4().hex)
+
+    def clear_change_log(self):
+        """Empty the change log after the stats table was rebuilt; replicas then take a full copy."""
+        self.connection.execute('DELETE FROM change_log')
+        self.connection.execute('DELETE FROM change_batches')
+        self.set_schema_info('change_log_epoch', uuid.uuid4().hex)
+
+    def create_season_tables(self):
+        """Create the players, teams, seasons, game_logs and season_totals tables.
+
+        game_logs is a WITHOUT ROWID table clustered on (player_id, season_id, game_date), so
+        one player's games for a range of seasons sit together on disk. season_totals holds
+        per-player, per-season sums precomputed from the game logs.
+        """
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS players (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_players_name ON players (name)')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS teams (
+                id INTEGER PRIMARY KEY,
+                abbreviation TEXT NOT NULL UNIQUE
+            )
+        ''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS seasons (
+                id INTEGER PRIMARY KEY,  -- The year the season starts, e.g. 2023 for 2023-24
+                label TEXT NOT NULL
+            )
+        ''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS game_logs (
+                player_id INTEGER NOT NULL REFERENCES players (id),
+                season_id INTEGER NOT NULL REFERENCES seasons (id),
+                game_date TEXT NOT NULL,
+                team_id INTEGER REFERENCES teams (id),
+                points REAL,
+                assists REAL,
+                rebounds REAL,
+                fgm INTEGER,
+                fga INTEGER,
+                tpm INTEGER,
+                tpa INTEGER,
+                PRIMARY KEY (player_id, season_id, game_date)
+            ) WITHOUT ROWID
+        ''')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS idx_game_logs_season ON game_logs (season_id, player_id)')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS season_totals (
+                player_id INTEGER NOT NULL REFERENCES players (id),
+                season_id INTEGER NOT NULL REFERENCES seasons (id),
+                games INTEGER NOT NULL,
+                points REAL,
+                assists REAL,
+                rebounds REAL,
+                fgm INTEGER,
+                fga INTEGER,
+                tpm INTEGER,
+                tpa INTEGER,
+                PRIMARY KEY (player_id, season_id)
+            ) WITHOUT ROWID
+        ''')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS idx_season_totals_season ON season_totals (season_id, player_id)')
+
+    def create_indexes(self):
+        """Create the name index and one index per stat column.
+
+        Each stat index also holds the name, so high/low lookups never touch the table.
+        """
         with self.connection:
-            self.connection.executemany('''
-                INSERT INTO stats (Name, Points, Assists, Rebounds, FG_percent, ThreePT_percent)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', data)
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_stats_name ON stats (Name)')
+            for column in STAT_COLUMNS:
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_stats_{column.lower()} ON stats ("{column}", Name)')
+        self.create_name_search()
+
+    def create_name_search(self):
+        """Create the triggers that mirror player names into the name_search index.
+
+        The index is rebuilt from the stats table in one pass after drop_indexes, or when its
+        highest rowid no longer matches the stats table's (another program added or removed the
+        newest players without the triggers). Both sides are a single seek, so checking an up
+        to date index does not get slower as the table grows.
+        """
+        with self.connection:
+            in_sync = self.connection.execute('''
+                SELECT (SELECT MAX(id) FROM stats)
+                    IS (SELECT rowid FROM name_search ORDER BY rowid DESC LIMIT 1)
+            ''').fetchone()[0]
+            if self.get_schema_info('name_search') != 'ready' or not in_sync:
+                # Recreating the table is much faster than deleting every entry
+                self.connection.execute('DROP TABLE name_search')
+                self.connection.execute('''
+                    CREATE VIRTUAL TABLE name_search USING fts5(norm_name, tokenize = 'trigram')
+                ''')
+                # FTS5 adds rows several times faster in rowid order than in the name order
+                # a covering index scan would return them in
+                self.connection.execute(
+                    'INSERT INTO name_search (rowid, norm_name) SELECT id, normalize_name(Name) FROM stats ORDER BY id')
+                self.set_schema_info('name_search', 'ready')
+            create_name_triggers(self.connection)
+
+    def drop_indexes(self):
+        """Drop the secondary indexes (used for bulk loads and benchmarks)."""
+        with self.connection:
+            self.connection.execute('DROP INDEX IF EXISTS idx_stats_name')
+            for column in STAT_COLUMNS:
+                self.connection.execute(f'DROP INDEX IF EXISTS idx_stats_{column.lower()}')
+            for trigger in NAME_TRIGGERS:
+                self.connection.execute(f'DROP TRIGGER IF EXISTS temp.{trigger}')
+                self.connection.execute(f'DROP TRIGGER IF EXISTS main.{trigger}')
+            self.set_schema_info('name_search', 'stale')
+
+    def file_hash(self):
+        """Return the SHA-256 hash of the CSV file."""
+        digest = hashlib.sha256()
+        with open(self.filename, mode='rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def needs_reload(self):
+        """Check whether the CSV file changed since it was last loaded into the database."""
+        info = os.stat(self.filename)
+        if (self.get_schema_info('source_path') == os.path.abspath(self.filename)
+                and self.get_schema_info('source_mtime') == str(info.st_mtime_ns)
+                and self.get_schema_info('source_size') == str(info.st_size)):
+            return False
+
+        # The timestamp moved, so only reload if the contents really changed
+        stored_hash = self.get_schema_info('source_sha256')
+        if stored_hash is not None and stored_hash == self.file_hash():
+            with self.connection:
+                self.set_source_info(info, stored_hash)
+            return False
+        return True
+
+    def set_source_info(self, info, sha256):
+        """Remember which version of the CSV file the database was loaded from."""
+        self.set_schema_info('source_path', os.path.abspath(self.filename))
+        self.set_schema_info('source_mtime', info.st_mtime_ns)
+        self.set_schema_info('source_size', info.st_size)
+        self.set_schema_info('source_sha256', sha256)
+
+    def reload_data(self, report=False):
+        """Replace the rows of the stats table that came from the CSV file.
+
+        Players added by hand or imported are kept. Career lines computed from game logs
+        (rows with a player_id) are kept too, and replace the CSV line of the same player.
+        """
+        with self.writing():
+            # Building the indexes once at the end is cheaper than updating them per row
+            self.drop_indexes()
+            with self.connection:
+                self.connection.execute("DELETE FROM stats WHERE origin = 'csv' AND player_id IS NULL")
+                self.clear_change_log()
+            total = self.load_data(report=report)
+            with self.connection:
+                self.connection.execute('''
+                    DELETE FROM stats WHERE origin = 'csv' AND player_id IS NULL
+                    AND Name IN (SELECT Name FROM stats WHERE player_id IS NOT NULL)
+                ''')
+            self.create_indexes()
+            with self.connection:
+                self.set_source_info(os.stat(self.filename), self.file_hash())
+        return total
+
+    def read_batches(self, batch_size=LOAD_BATCH_SIZE):
+        """Yield the rows of the source file as lists of at most batch_size tuples.
+
+        Parquet and Arrow files keep missing values as None; the CSV turns them into 0.0.
+        """
+        if file_format(self.filename) == 'csv':
+            yield from self.read_csv_batches(batch_size)
+            return
+        for batch in read_columnar_batches(self.filename, batch_size):
+            yield list(zip(*(column.to_pylist() for column in batch.columns)))
+
+    def read_csv_batches(self, batch_size=LOAD_BATCH_SIZE):
+        """Yield the rows of the CSV file as lists of at most batch_size tuples."""
+        with open(self.filename, mode='r', newline='') as file:
+            reader = csv.DictReader(file)
+            batch = []
+            for row in reader:
+                batch.append((
+                    row['Name'],
+                    self.validate_float(row['Points']),
+                    self.validate_float(row['Assists']),
+                    self.validate_float(row['Rebounds']),
+                    self.validate_float(row['FG%']),
+                    self.validate_float(row['3PT%'])
+                ))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    def set_bulk_load_pragmas(self):
+        """Tune SQLite for a bulk insert and return the settings to restore afterwards."""
+        previous = {
+            'synchronous': self.connection.execute('PRAGMA synchronous').fetchone()[0],
+            'cache_size': self.connection.execute('PRAGMA cache_size').fetchone()[0]
+        }
+        if not self.is_persistent():
+            # File databases stay in WAL mode, which already suits bulk inserts
+            self.connection.execute('PRAGMA journal_mode = MEMORY')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute(f'PRAGMA cache_size = {-BULK_CACHE_KIB}')
+        return previous
+
+    def restore_pragmas(self, previous):
+        """Restore the pragma settings saved by set_bulk_load_pragmas."""
+        for pragma, value in previous.items():
+            self.connection.execute(f'PRAGMA {pragma} = {int(value)}')
+
+    def load_data(self, batch_size=LOAD_BATCH_SIZE, report=False):
+        """Stream data from the source file into the database, one transaction per batch."""
+        start = time.perf_counter()
+        total = 0
+        previous = self.set_bulk_load_pragmas()
+        try:
+            for batch in self.read_batches(batch_size):
+                with self.connection:
+                    self.connection.executemany('''
+                        INSERT INTO stats (Name, Points, Assists, Rebounds, FG_percent, ThreePT_percent, origin)
+                        VALUES (?, ?, ?, ?, ?, ?, 'csv')
+                    ''', batch)
+                total += len(batch)
+        finally:
+            self.restore_pragmas(previous)
+            self.aggregates.invalidate()
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else float('inf')
+        self.last_load_stats = {'rows': total, 'seconds': elapsed, 'rows_per_second': rate}
+        if report:
+            print(f"Loaded {total} rows in {elapsed:.2f} seconds ({rate:,.0f} rows/second).")
+        return total
 
     def validate_float(self, value):
         """Validate if the input is a float and return a default value if not."""
@@ -65,37 +933,121 @@ class BasketballStats:
         except ValueError:
             return 0.0  # Default value for invalid input
 
-    def display_all_player_stats(self):
-        """Display stats for all players."""
-        with self.connection:
-            cursor = self.connection.cursor()
-            cursor.execute('SELECT * FROM stats')
-            rows = cursor.fetchall()
-
-            print("\nWelcome to the Basketball database!\n")
-            print("Current Player Stats:\n")
-            
-            for row in rows:
-                name = row[0]  # Assuming the first column is the player's name
-                try:
-                    points = float(row[1])  # Convert to float
-                    assists = float(row[2])  # Convert to float
-                    rebounds = float(row[3])  # Convert to float
-                    fg_percentage = float(row[4])  # Convert to float
-                    three_pt_percentage = float(row[5])  # Convert to float
-                except ValueError:
-                    # Handle the case where conversion fails
-                    print(f"Data for {name} is corrupted and cannot be displayed properly.")
-                    continue
-                
-                print(f"Name: {name}")
-                print(f"Points: {points:.2f}")
-                print(f"Assists: {assists:.2f}")
-                print(f"Rebounds: {rebounds:.2f}")
-                print(f"FG%: {fg_percentage:.2f}")
-                print(f"3PT%: {three_pt_percentage:.2f}")
-                print("****************************************")
+    def iter_player_rows(self, columns=None, batch_size=DISPLAY_BATCH_SIZE, offset=0, limit=None):
+        """Yield (Name, stat, ...) rows in insertion order, fetching batch_size rows at a time.
+
+        columns selects which stats follow the name (all five by default); offset and limit
+        select a window of players.
+        """
+        columns = [resolve_stat(stat) for stat in (columns or STAT_COLUMNS)]
+        selected = ', '.join(f'"{column}"' for column in columns)
+        with self.reading() as connection:
+            cursor = connection.cursor()
+            cursor.execute(f'SELECT Name, {selected} FROM stats ORDER BY id LIMIT ? OFFSET ?',
+                           (-1 if limit is None else limit, offset))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    def format_player(self, row, columns):
+        """Return the display block for one player row from iter_player_rows; missing stats show as NA."""
+        name = row[0]
+        try:
+            values = ['NA' if value is None else format(float(value), '.2f') for value in row[1:]]
+        except (TypeError, ValueError):
+            # Handle the case where conversion fails
+            return f"Data for {name} is corrupted and cannot be displayed properly.\n"
+        lines = [f"Name: {name}"]
+        lines += [f"{CSV_FIELDS[column]}: {value}" for column, value in zip(columns, values)]
+        lines.append("****************************************")
+        return "\n".join(lines) + "\n"
+
+    def display_all_player_stats(self, page_size=None, offset=0, limit=None, columns=None, out=None):
+        """Display stats for all players.
+
+        Output is streamed from the cursor and written once per fetch batch. With page_size
+        set, each page of page_size players is read on its own and the user is asked before
+        the next one, so no connection is held while waiting at the prompt.
+        """
+        out = out or sys.stdout
+        columns = [resolve_stat(stat) for stat in (columns or STAT_COLUMNS)]
+        out.write("\nWelcome to the Basketball database!\n\nCurrent Player Stats:\n\n")
 
+        if not page_size:
+            page = []
+            for row in self.iter_player_rows(columns, offset=offset, limit=limit):
+                page.append(self.format_player(row, columns))
+                if len(page) == DISPLAY_BATCH_SIZE:
+                    out.write("".join(page))
+                    out.flush()
+                    page = []
+            if page:
+                out.write("".join(page))
+                out.flush()
+            return
+
+        shown = 0
+        while limit is None or shown < limit:
+            count = page_size if limit is None else min(page_size, limit - shown)
+            rows = list(self.iter_player_rows(columns, offset=offset + shown, limit=count))
+            if rows:
+                out.write("".join(self.format_player(row, columns) for row in rows))
+                out.flush()
+            shown += len(rows)
+            if len(rows) < count or input("Press Enter for the next page or q to stop: ").strip().lower() == 'q':
+                return
+
+    def export_stats(self, destination, fmt='csv', columns=None, batch_size=DISPLAY_BATCH_SIZE):
+        """Stream the stats table to a file path or open file ('-' for stdout) as CSV, JSON Lines, Parquet or Arrow.
+
+        Every format uses the basketball_data.csv column names, so an export can be loaded
+        again. Parquet and Arrow keep missing stats as nulls. Returns the number of players written.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(EXPORT_FORMATS)}.")
+        columns = [resolve_stat(stat) for stat in (columns or STAT_COLUMNS)]
+        fields = ['Name'] + [CSV_FIELDS[column] for column in columns]
+
+        if fmt in ('parquet', 'arrow'):
+            if destination == '-':
+                raise ValueError(f"{fmt} exports must be written to a file.")
+            return write_columnar(destination, fmt, fields[1:], self.iter_player_rows(columns, batch_size=batch_size))
+
+        if destination == '-':
+            file, close = sys.stdout, False
+        elif isinstance(destination, str):
+            file, close = open(destination, 'w', newline='', encoding='utf-8'), True
+        else:
+            file, close = destination, False
+
+        count = 0
+        try:
+            writer = csv.writer(file) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(fields)
+            for row in self.iter_player_rows(columns, batch_size=batch_size):
+                if writer:
+                    writer.writerow(['NA' if value is None else value for value in row])
+                else:
+                    file.write(json.dumps(dict(zip(fields, row))) + "\n")
+                count += 1
+        finally:
+            if close:
+                file.close()
+        return count
+
+    def export_menu(self):
+        """Ask for a file name and format and export all player stats."""
+        path = input("Enter the file to export to (- for the screen): ").strip()
+        fmt = input(f"Enter the format ({', '.join(EXPORT_FORMATS)}): ").strip().lower() or 'csv'
+        try:
+            count = self.export_stats(path, fmt)
+        except (OSError, ValueError, ImportError) as error:
+            print(f"Could not export: {error}")
+            return
+        print(f"\nExported {count} players.")
 
     def display_menu(self):
         """Display the main menu and handle user input."""
@@ -104,20 +1056,23 @@ class BasketballStats:
             print("1. Find specific stats for a player")
             print("2. View all player stats")
             print("3. Edit the database")
-            print("4. Quit")
-            choice = input("Enter your choice (1, 2, 3, or 4): ").strip().lower()
+            print("4. Export all player stats")
+            print("5. Quit")
+            choice = input("Enter your choice (1, 2, 3, 4, or 5): ").strip().lower()
 
             if choice == "1":
                 self.specific_stats_menu()
             elif choice == "2":
-                self.display_all_player_stats()
+                self.display_all_player_stats(page_size=DISPLAY_PAGE_SIZE)
             elif choice == "3":
                 self.edit_database_menu()
             elif choice == "4":
+                self.export_menu()
+            elif choice == "5":
                 print("Exiting the program. Goodbye!")
                 break
             else:
-                print("Invalid choice. Please enter 1, 2, 3, or 4.")
+                print("Invalid choice. Please enter 1, 2, 3, 4, or 5.")
 
     def specific_stats_menu(self):
         """Display the specific stats menu and handle user input."""
@@ -148,8 +1103,9 @@ class BasketballStats:
             print("2. Delete a player")
             print("3. Edit player stats")
             print("4. Add a player from the BBall Ref Website")
-            print("5. Go back to the main menu")
-            choice = input("Enter your choice (1, 2, 3, 4, or 5): ").strip().lower()
+            print("5. Add many players from the BBall Ref Website")
+            print("6. Go back to the main menu")
+            choice = input("Enter your choice (1, 2, 3, 4, 5, or 6): ").strip().lower()
 
             if choice == "1":
                 self.add_player()
@@ -160,39 +1116,100 @@ class BasketballStats:
             elif choice == "4":
                 self.add_database()
             elif choice == "5":
+                self.bulk_import_menu()
+            elif choice == "6":
                 break
             else:
-                print("Invalid choice. Please enter 1, 2, 3, 4, or 5.")
+                print("Invalid choice. Please enter 1, 2, 3, 4, 5, or 6.")
 
     def get_player_name(self, prompt):
         """Get the player's full name from the user."""
         return input(prompt).strip()
 
-    def handle_name_conflict(self, cursor, query, name_input):
+    def search_players(self, name_input, limit=10):
+        """Search for players by name, ignoring case and accents.
+
+        Returns (matches, contains): matches is a list of (id, Name, score) tuples with the
+        best match first, and contains is True when the matched names contain the search
+        text or False when they are only close (misspelled) suggestions.
+        """
+        query = normalize_name(name_input)
+        if not query:
+            return [], False
+        with self.reading() as connection:
+            return self.search_candidates(connection.cursor(), query, limit)
+
+    def search_candidates(self, cursor, query, limit):
+        """Run the search_players queries on a cursor and return (matches, contains)."""
+        if len(query) < 3:
+            # Too short for trigrams, so fall back to a prefix match
+            cursor.execute('''
+                SELECT stats.id, stats.Name, name_search.norm_name FROM name_search
+                JOIN stats ON stats.id = name_search.rowid
+                WHERE name_search.norm_name LIKE ? ESCAPE '\\' LIMIT ?
+            ''', (query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%', limit))
+            return [(row[0], row[1], name_similarity(query, row[2])) for row in cursor.fetchall()], True
+
+        # A quoted phrase on a trigram index matches any name containing the text
+        phrase = '"' + query.replace('"', '""') + '"'
+        cursor.execute('''
+            SELECT stats.id, stats.Name, name_search.norm_name FROM name_search
+            JOIN stats ON stats.id = name_search.rowid
+            WHERE name_search MATCH ? LIMIT ?
+        ''', (phrase, SEARCH_CANDIDATES))
+        rows = cursor.fetchall()
+        contains = bool(rows)
+
+        if not rows:
+            # No name contains the text, so collect names containing part of it instead
+            segments = name_segments(query)
+            if segments:
+                cursor.execute('''
+                    SELECT stats.id, stats.Name, name_search.norm_name FROM name_search
+                    JOIN stats ON stats.id = name_search.rowid
+                    WHERE name_search MATCH ? LIMIT ?
+                ''', (' OR '.join('"' + segment.replace('"', '""') + '"' for segment in segments),
+                      SEARCH_CANDIDATES))
+                rows = cursor.fetchall()
+
+        ranked = sorted(((row[0], row[1], name_similarity(query, row[2])) for row in rows),
+                        key=lambda match: (-match[2], match[1]))
+        return ranked[:limit], contains
+
+    def choose_player(self, names, header):
+        """Let the user pick one of several player names, or 0 to cancel."""
+        print(header)
+        for idx, name in enumerate(names, 1):
+            print(f"{idx}. {name}")
+        while True:
+            try:
+                choice = int(input("Enter the number of the player you want to select (0 to cancel): ").strip())
+                if choice == 0:
+                    return None
+                if 1 <= choice <= len(names):
+                    return names[choice - 1]
+                else:
+                    print("Invalid choice. Please select a valid number.")
+            except ValueError:
+                print("Invalid input. Please enter a number.")
+
+    def handle_name_conflict(self, name_input):
         """Handle conflicts when multiple players have the same name."""
         if len(name_input.split()) < 2:
             print("Error: Please enter both first and last names.")
             return None
 
-        cursor.execute(query, ('%' + name_input + '%',))
-        rows = cursor.fetchall()
-        
-        if len(rows) == 1:
-            return rows[0][0]
-        
-        if len(rows) > 1:
-            print("Multiple players found:")
-            for idx, row in enumerate(rows, 1):
-                print(f"{idx}. {row[0]}")
-            while True:
-                try:
-                    choice = int(input("Enter the number of the player you want to select: ").strip())
-                    if 1 <= choice <= len(rows):
-                        return rows[choice - 1][0]
-                    else:
-                        print("Invalid choice. Please select a valid number.")
-                except ValueError:
-                    print("Invalid input. Please enter a number.")
+        matches, contains = self.search_players(name_input)
+        names = [match[1] for match in matches]
+
+        if contains and len(names) == 1:
+            return names[0]
+
+        if contains and len(names) > 1:
+            return self.choose_player(names, "Multiple players found:")
+
+        if names:
+            return self.choose_player(names, "No exact match. Did you mean:")
 
         return None
 
@@ -205,116 +1222,475 @@ class BasketballStats:
         fg_percent = self.get_valid_number("Enter FG%: ")
         three_pt_percent = self.get_valid_number("Enter 3PT%: ")
 
-        with self.connection:
-            self.connection.execute('''
-                INSERT INTO stats (Name, Points, Assists, Rebounds, FG_percent, ThreePT_percent)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (name, points, assists, rebounds, fg_percent, three_pt_percent))
+        self.insert_player(name, dict(zip(STAT_COLUMNS, (points, assists, rebounds, fg_percent, three_pt_percent))))
 
         print("Player added successfully.")
         print("*" * 40)  # Separator line
     
+    def get_http_cache(self):
+        """Return the cache used for Basketball Reference pages, creating it if needed."""
+        if self.http_cache is None:
+            self.http_cache = HTTPCache()
+        return self.http_cache
+
+    def get_player_index(self, base_url=BBREF_URL):
+        """Return the name to player URL index for Basketball Reference, loading it if needed."""
+        if self.player_index is None or self.player_index.base_url != base_url:
+            self.player_index = PlayerURLIndex(normalize_name, self.get_http_cache(), INDEX_FILE, base_url)
+        return self.player_index
+
     def add_database(self):
         """Search for a player on Basketball Reference and add to the database if found."""
+        import requests
+        from extraction import parse_player_page
+
         player_name = input("Enter the name of the player to search for: ").strip()
-        url = 'https://www.basketball-reference.com/players/'
-
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text_content = soup.get_text().lower()
-
-        if player_name.lower() in text_content:
-            print(f"The player '{player_name}' was found on the webpage.")
-            names = player_name.split()
-            if len(names) == 2:
-                first_name, last_name = names
-                last_name_part = last_name[:5].lower()
-                last_name_first = last_name[:1].lower()
-                first_name_part = first_name[:2].lower()
-                player_url = f'https://www.basketball-reference.com/players/{last_name_first}/{last_name_part}{first_name_part}01.html'
-
-                response = requests.get(player_url)
-                soup = BeautifulSoup(response.text, 'html.parser')
-                data = soup.find_all('p')
-                player = soup.find('h1').text.strip()
-                print(player)
-                name = player
-                
-                # Extract statistics
-                def extract_stat(index):
-                    try:
-                        stat_text = data[index].get_text(strip=True)
-                        # Convert to float and handle any non-numeric values
-                        return float(stat_text.replace('%', '').replace(',', ''))
-                    except (ValueError, IndexError):
-                        return 0.0
-
-                if extract_stat(16)>100 or extract_stat(18)>100 or extract_stat(20)>100 or extract_stat(22)>100 or extract_stat(24)>100:
-                    print("Data is formatted incorrectly in website. Unable to continue.")
-                else:
-                    points = extract_stat(16)
-                    rebounds = extract_stat(18)
-                    assists = extract_stat(20)
-                    fieldgoal = extract_stat(22)
-                    threepoint = extract_stat(24)
-                    
-                    with self.connection:
-                        self.connection.execute('''
-                            INSERT INTO stats (Name, Points, Assists, Rebounds, FG_percent, ThreePT_percent)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (name, points, assists, rebounds, fieldgoal, threepoint))
-
-                    print("Player added from Basketball Reference.")
-                    print("*" * 40)  # Separator line
-            else:
-                print("Error: Please enter both first and last names.")
-        else:
+        if len(player_name.split()) < 2:
+            print("Error: Please enter both first and last names.")
+            return
+
+        try:
+            matches = self.get_player_index().lookup(player_name)
+        except requests.RequestException as error:
+            print(f"Could not reach Basketball Reference: {error}")
+            return
+
+        if not matches:
             print(f"No data found for player '{player_name}' on the webpage.")
+            return
+
+        print(f"The player '{player_name}' was found on the webpage.")
+        player_url = matches[0][1]
+        if len(matches) > 1:
+            # Several players share the name, so show their page ids (jamesmi01, jamesmi02)
+            labels = [f"{name} ({url.rsplit('/', 1)[-1][:-len('.html')]})" for name, url in matches]
+            choice = self.choose_player(labels, "Multiple players found:")
+            if choice is None:
+                return
+            player_url = matches[labels.index(choice)][1]
+
+        try:
+            page = self.get_http_cache().get(player_url)
+        except requests.RequestException as error:
+            print(f"Could not load the page for '{player_name}': {error}")
+            return
+
+        try:
+            player = parse_player_page(page)
+        except ValueError as error:
+            print(error)
+            return
+        print(player['Name'])
+        self.insert_players([player])
+
+        print("Player added from Basketball Reference.")
+        print("*" * 40)  # Separator line
+
+    def insert_players(self, players):
+        """Insert players given as dicts with Name and the stats columns in one transaction."""
+        with self.batch() as batch:
+            for player in players:
+                batch.insert(player['Name'], {column: player.get(column) for column in STAT_COLUMNS})
+
+    def fetch_player(self, player_name, limiter, base_url=BBREF_URL, backoff=RETRY_BACKOFF):
+        """Download and parse one player's page (runs on an import worker thread)."""
+        from extraction import parse_player_page
+
+        if len(player_name.split()) < 2:
+            raise ValueError("Please enter both first and last names.")
+        matches = self.get_player_index(base_url).lookup(player_name, limiter)
+        if not matches:
+            raise ValueError("Not found on Basketball Reference.")
+        if len(matches) > 1:
+            raise ValueError(f"{len(matches)} players share this name; add them one at a time.")
+        page = fetch_with_retries(self.get_http_cache(), matches[0][1], limiter, backoff=backoff)
+        return parse_player_page(page)
+
+    def bulk_import(self, player_names, max_workers=IMPORT_WORKERS, rate=REQUESTS_PER_SECOND,
+                    batch_size=IMPORT_BATCH_SIZE, base_url=BBREF_URL, backoff=RETRY_BACKOFF):
+        """Import many players from Basketball Reference at once.
+
+        Pages are fetched and parsed on a pool of worker threads, with requests to each host
+        rate limited and retried on failure. Parsed players are inserted batch_size at a time.
+        Returns {'added': [names], 'failed': {name: reason}}.
+        """
+        import requests
+
+        limiter = RateLimiter(rate)
+        added, failed, pending = [], {}, []
+        names = list(dict.fromkeys(name.strip() for name in player_names if name.strip()))
+        self.get_player_index(base_url)  # Create the shared cache and index before the workers start
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(self.fetch_player, name, limiter, base_url, backoff): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    pending.append(future.result())
+                except (requests.RequestException, ValueError) as error:
+                    failed[name] = str(error)
+                    continue
+                if len(pending) >= batch_size:
+                    self.insert_players(pending)
+                    added += [player['Name'] for player in pending]
+                    pending = []
+
+        if pending:
+            self.insert_players(pending)
+            added += [player['Name'] for player in pending]
+        return {'added': added, 'failed': failed}
+
+    def bulk_import_file(self, path, **options):
+        """Import every player listed in a text file, one 'First Last' name per line."""
+        with open(path, encoding='utf-8') as file:
+            return self.bulk_import(file, **options)
+
+    def bulk_import_menu(self):
+        """Ask for a file of player names and import them all from Basketball Reference."""
+        path = input("Enter the path of a file with one player name per line: ").strip()
+        try:
+            result = self.bulk_import_file(path)
+        except OSError as error:
+            print(f"Could not read '{path}': {error}")
+            return
+        print(f"Added {len(result['added'])} players from Basketball Reference.")
+        for name, reason in result['failed'].items():
+            print(f"Could not add '{name}': {reason}")
+        print("*" * 40)  # Separator line
 
     def delete_player(self):
         """Delete a player from the database."""
         name_input = self.get_player_name("Enter the name of the player to delete (First Last): ")
+        name_to_delete = self.handle_name_conflict(name_input)
 
-        with self.connection:
-            cursor = self.connection.cursor()
-            name_to_delete = self.handle_name_conflict(cursor, 'SELECT Name FROM stats WHERE Name LIKE ?', name_input)
+        if name_to_delete and self.remove_player(name_to_delete):
+            print(f"Player '{name_to_delete}' deleted successfully.")
+        else:
+            print("Player not found or could not be deleted.")
 
-            if name_to_delete:
-                cursor.execute('DELETE FROM stats WHERE Name = ?', (name_to_delete,))
-                print(f"Player '{name_to_delete}' deleted successfully.")
-            else:
-                print("Player not found or could not be deleted.")
-        
         print("*" * 40)  # Separator line
 
     def edit_player_stats(self):
         """Edit an existing player's stats."""
         name_input = self.get_player_name("Enter the name of the player to edit (First Last) (Case sensitive): ")
+        name_to_edit = self.handle_name_conflict(name_input)
 
-        with self.connection:
-            cursor = self.connection.cursor()
-            name_to_edit = self.handle_name_conflict(cursor, 'SELECT Name FROM stats WHERE Name LIKE ?', name_input)
+        if name_to_edit:
+            print(f"Editing stats for player '{name_to_edit}':")
+            points = self.get_valid_number("Enter new points: ")
+            assists = self.get_valid_number("Enter new assists: ")
+            rebounds = self.get_valid_number("Enter new rebounds: ")
+            fg_percent = self.get_valid_number("Enter new FG%: ")
+            three_pt_percent = self.get_valid_number("Enter new 3PT%: ")
+            self.update_player(name_to_edit, dict(zip(STAT_COLUMNS, (points, assists, rebounds, fg_percent,
+                                                                     three_pt_percent))))
 
-            if name_to_edit:
-                print(f"Editing stats for player '{name_to_edit}':")
-                points = self.get_valid_number("Enter new points: ")
-                assists = self.get_valid_number("Enter new assists: ")
-                rebounds = self.get_valid_number("Enter new rebounds: ")
-                fg_percent = self.get_valid_number("Enter new FG%: ")
-                three_pt_percent = self.get_valid_number("Enter new 3PT%: ")
+            print(f"Stats for player '{name_to_edit}' updated successfully.")
+        else:
+            print("Player not found or could not be updated.")
 
-                cursor.execute('''
-                    UPDATE stats
-                    SET Points = ?, Assists = ?, Rebounds = ?, FG_percent = ?, ThreePT_percent = ?
-                    WHERE Name = ?
-                ''', (points, assists, rebounds, fg_percent, three_pt_percent, name_to_edit))
-                
-                print(f"Stats for player '{name_to_edit}' updated successfully.")
-            else:
-                print("Player not found or could not be updated.")
-        
         print("*" * 40)  # Separator line
 
+    def insert_player(self, name, stats):
+        """Add one player; stats maps stat names to values and missing stats are left empty."""
+        with self.batch() as batch:
+            batch.insert(name, stats)
+
+    def update_player(self, name, stats):
+        """Change some or all stats of every player with this exact name; returns the rows changed."""
+        with self.batch() as batch:
+            return batch.update(name, stats)
+
+    def remove_player(self, name):
+        """Delete every player with this exact name; returns the rows deleted."""
+        with self.batch() as batch:
+            return batch.delete(name)
+
+    @contextlib.contextmanager
+    def batch(self, label=None):
+        """Apply many inserts, updates and deletes in one transaction, logged so they can be undone.
+
+        Usage: with stats.batch() as batch: batch.insert(...); batch.update(...); batch.delete(...)
+        Everything is committed together when the block ends, or rolled back if it raises.
+        """
+        with self.writing() as connection:
+            if not connection.in_transaction:
+                connection.execute('BEGIN')
+            batch = StatsBatch(connection)
+            yield batch
+            if batch.changes:
+                # A new edit means the undone ones can no longer be redone
+                connection.execute("UPDATE change_batches SET status = 'discarded' WHERE status = 'undone'")
+                self.log_changes(connection, 'edit', label, batch.changes)
+                self.track_changes(batch.changes)
+
+    def log_changes(self, connection, kind, label, changes):
+        """Write a batch of (op, row_id, before, after) changes to the change log; returns the batch id."""
+        batch_id = connection.execute(
+            "INSERT INTO change_batches (kind, status, label, created_at) VALUES (?, 'done', ?, ?)",
+            (kind, label, time.time())).lastrowid
+        connection.executemany(
+            'INSERT INTO change_log (batch_id, op, row_id, before, after) VALUES (?, ?, ?, ?, ?)',
+            [(batch_id, op, row_id, json.dumps(before, separators=(',', ':')) if before else None,
+              json.dumps(after, separators=(',', ':')) if after else None)
+             for op, row_id, before, after in changes])
+        return batch_id
+
+    def track_changes(self, changes):
+        """Update the aggregate cache for applied (op, row_id, before, after) changes."""
+        for op, _, before, after in changes:
+            if op == 'insert':
+                self.aggregates.add(row_values(after))
+            elif op == 'delete':
+                self.aggregates.remove(row_values(before))
+            else:
+                self.aggregates.update(row_values(before), row_values(after))
+
+    def replay_batch(self, batch_id, kind):
+        """Apply an edit batch again ('redo') or its inverse ('undo'), logging what was applied."""
+        with self.writing() as connection:
+            changes = [(op, row_id, json.loads(before) if before else None, json.loads(after) if after else None)
+                       for op, row_id, before, after in connection.execute(
+                           'SELECT op, row_id, before, after FROM change_log WHERE batch_id = ? ORDER BY id',
+                           (batch_id,))]
+            if kind == 'undo':
+                inverse = {'insert': 'delete', 'delete': 'insert', 'update': 'update'}
+                changes = [(inverse[op], row_id, after, before) for op, row_id, before, after in reversed(changes)]
+            apply_changes(connection, changes)
+            self.log_changes(connection, kind, f'{kind} {batch_id}', changes)
+            connection.execute('UPDATE change_batches SET status = ? WHERE id = ?',
+                               ('undone' if kind == 'undo' else 'done', batch_id))
+            self.track_changes(changes)
+        return batch_id
+
+    def undo(self):
+        """Undo the most recent edit batch; returns its id, or None if there is nothing to undo."""
+        with self.writing() as connection:
+            row = connection.execute(
+                "SELECT id FROM change_batches WHERE kind = 'edit' AND status = 'done' ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            return self.replay_batch(row[0], 'undo') if row else None
+
+    def redo(self):
+        """Redo the most recently undone edit batch; returns its id, or None if there is nothing to redo."""
+        with self.writing() as connection:
+            row = connection.execute(
+                "SELECT id FROM change_batches WHERE kind = 'edit' AND status = 'undone' ORDER BY id LIMIT 1"
+            ).fetchone()
+            return self.replay_batch(row[0], 'redo') if row else None
+
+    def replicate_to(self, path):
+        """Bring a copy of this database in the file at path up to date; returns the changes copied.
+
+        The first time (and after the CSV was reloaded or game logs were added) the whole
+        database is copied with SQLite's backup API. After that only the change log entries
+        the copy has not seen are replayed.
+        """
+        replica = sqlite3.connect(path)
+        try:
+            self.register_functions(replica)
+            with self.writing() as connection:
+                epoch = self.get_schema_info('change_log_epoch')
+                last = connection.execute('SELECT COALESCE(MAX(id), 0) FROM change_log').fetchone()[0]
+                try:
+                    saved = dict(replica.execute(
+                        "SELECT key, value FROM schema_info WHERE key IN ('replica_epoch', 'replica_position')"))
+                except sqlite3.OperationalError:
+                    saved = {}
+
+                if saved.get('replica_epoch') != epoch:
+                    connection.commit()  # The backup cannot start inside a transaction
+                    connection.backup(replica)
+                    copied = last
+                else:
+                    changes = connection.execute(
+                        'SELECT op, row_id, before, after FROM change_log WHERE id > ? ORDER BY id',
+                        (int(saved['replica_position']),))
+                    with replica:
+                        create_name_triggers(replica)  # Keeps the copy's name search index in sync
+                        copied = apply_changes(replica, changes)
+            with replica:
+                replica.executemany('INSERT OR REPLACE INTO schema_info (key, value) VALUES (?, ?)',
+                                    [('replica_epoch', epoch), ('replica_position', str(last))])
+        finally:
+            replica.close()
+        return copied
+
+    def top_n(self, stat, n=10, ascending=False):
+        """Return the n (Name, value) pairs with the highest stat, or the lowest if ascending."""
+        return [(entry['name'], entry['value']) for entry in self.leaderboard(stat, n, bottom=ascending)]
+
+    def averages(self, stats=None):
+        """Return {stat: average} for the given stats (all five by default)."""
+        return {stat_key(resolve_stat(stat)): self.get_average(stat) for stat in (stats or STAT_COLUMNS)}
+
+    def season_id(self, season):
+        """Return the seasons id for 2023 or '2023-24', adding the season if it is new."""
+        start_year = int(str(season).split('-')[0])
+        self.connection.execute('INSERT OR IGNORE INTO seasons (id, label) VALUES (?, ?)',
+                                (start_year, f"{start_year}-{(start_year + 1) % 100:02d}"))
+        return start_year
+
+    def team_id(self, abbreviation):
+        """Return the teams id for an abbreviation such as 'LAL', adding the team if it is new."""
+        if not abbreviation:
+            return None
+        self.connection.execute('INSERT OR IGNORE INTO teams (abbreviation) VALUES (?)', (abbreviation,))
+        return self.connection.execute('SELECT id FROM teams WHERE abbreviation = ?', (abbreviation,)).fetchone()[0]
+
+    def player_id(self, name, create=False):
+        """Return the players id for a name; raise KeyError if unknown and ValueError if ambiguous."""
+        with self.reading() as connection:
+            rows = connection.execute('SELECT id FROM players WHERE name = ?', (name,)).fetchall()
+        if len(rows) > 1:
+            raise ValueError(f"{len(rows)} players are named '{name}'; pass player_id instead.")
+        if rows:
+            return rows[0][0]
+        if not create:
+            raise KeyError(name)
+        return self.connection.execute('INSERT INTO players (name) VALUES (?)', (name,)).lastrowid
+
+    def add_game_logs(self, logs, refresh=True):
+        """Insert game log lines in one transaction and update the precomputed aggregates.
+
+        Each log is a dict with 'player' (or 'player_id'), 'season', 'date', and optionally
+        'team', 'points', 'assists', 'rebounds', 'fgm', 'fga', 'tpm' and 'tpa'. A game that
+        is already stored for the player is replaced. Returns the number of lines written.
+        """
+        touched = set()
+        rows = []
+        with self.writing():
+            for log in logs:
+                player_id = log.get('player_id') or self.player_id(log['player'], create=True)
+                season_id = self.season_id(log['season'])
+                touched.add((player_id, season_id))
+                rows.append((player_id, season_id, log['date'], self.team_id(log.get('team')),
+                             *(log.get(key) for key in ['points', 'assists', 'rebounds', 'fgm', 'fga', 'tpm', 'tpa'])))
+            self.connection.executemany('''
+                INSERT OR REPLACE INTO game_logs
+                    (player_id, season_id, game_date, team_id, points, assists, rebounds, fgm, fga, tpm, tpa)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        if refresh:
+            self.refresh_career_stats(touched)
+        return len(rows)
+
+    def load_game_logs(self, path, batch_size=LOAD_BATCH_SIZE):
+        """Stream a game log CSV (Player,Season,Team,Date,PTS,AST,TRB,FGM,FGA,3PM,3PA) into the database.
+
+        Each batch is one transaction; the career aggregates are refreshed once at the end.
+        """
+        touched = set()
+        total = 0
+        with open(path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            while True:
+                batch = []
+                for row in reader:
+                    log = {key: row.get(field) for field, key in GAME_LOG_FIELDS.items()}
+                    for key in ['points', 'assists', 'rebounds', 'fgm', 'fga', 'tpm', 'tpa']:
+                        log[key] = None if log[key] in (None, '', 'NA') else float(log[key])
+                    batch.append(log)
+                    if len(batch) >= batch_size:
+                        break
+                if not batch:
+                    break
+                total += self.add_game_logs(batch, refresh=False)
+                touched.update((self.player_id(log['player']), int(str(log['season']).split('-')[0]))
+                               for log in batch)
+        self.refresh_career_stats(touched)
+        return total
+
+    def refresh_career_stats(self, player_seasons=None):
+        """Recompute season_totals and the career line in stats from the game logs.
+
+        player_seasons is a set of (player_id, season_id) pairs that changed; by default
+        everything is recomputed. The career lines are not written to the change log, so
+        the next replicate_to takes a full copy.
+        """
+        with self.writing():
+            if player_seasons is None:
+                self.connection.execute('DELETE FROM season_totals')
+                self.connection.execute('''
+                    INSERT INTO season_totals
+                    SELECT player_id, season_id, COUNT(*), SUM(points), SUM(assists), SUM(rebounds),
+                           SUM(fgm), SUM(fga), SUM(tpm), SUM(tpa)
+                    FROM game_logs GROUP BY player_id, season_id
+                ''')
+                players = [row[0] for row in self.connection.execute('SELECT DISTINCT player_id FROM season_totals')]
+            else:
+                self.connection.executemany(
+                    'DELETE FROM season_totals WHERE player_id = ? AND season_id = ?', player_seasons)
+                self.connection.executemany('''
+                    INSERT INTO season_totals
+                    SELECT player_id, season_id, COUNT(*), SUM(points), SUM(assists), SUM(rebounds),
+                           SUM(fgm), SUM(fga), SUM(tpm), SUM(tpa)
+                    FROM game_logs WHERE player_id = ? AND season_id = ?
+                    GROUP BY player_id, season_id
+                ''', player_seasons)
+                players = sorted({player_id for player_id, _ in player_seasons})
+
+            # A player who already has a CSV row gets that row linked, not a second one
+            self.connection.executemany('''
+                UPDATE stats SET player_id = ?1
+                WHERE id = (SELECT MIN(stats.id) FROM stats JOIN players ON players.name = stats.Name
+                            WHERE players.id = ?1 AND stats.player_id IS NULL)
+                AND NOT EXISTS (SELECT 1 FROM stats WHERE player_id = ?1)
+            ''', [(player_id,) for player_id in players])
+            columns = ', '.join(f'"{column}"' for column in STAT_COLUMNS)
+            averages = ', '.join(SEASON_STAT_SQL[column] for column in STAT_COLUMNS)
+            updates = ', '.join(f'"{column}" = excluded."{column}"' for column in STAT_COLUMNS)
+            self.connection.executemany(f'''
+                INSERT INTO stats (player_id, Name, {columns})
+                SELECT players.id, players.name, {averages}
+                FROM season_totals JOIN players ON players.id = season_totals.player_id
+                WHERE season_totals.player_id = ?
+                GROUP BY players.id
+                ON CONFLICT (player_id) WHERE player_id IS NOT NULL DO UPDATE SET {updates}
+            ''', [(player_id,) for player_id in players])
+            # The game log tables are not in the change log either, so replicas need a full copy
+            self.set_schema_info('change_log_epoch', uuid.uuid4().hex)
+        self.aggregates.invalidate()
+
+    def season_averages(self, player_name, start_season=None, end_season=None):
+        """Return one {season, games, stat: average} dict per season for a player.
+
+        Read from season_totals with a primary key range seek, so it does not depend on how
+        many game rows are stored.
+        """
+        player_id = self.player_id(player_name)
+        start = int(str(start_season).split('-')[0]) if start_season is not None else -1
+        end = int(str(end_season).split('-')[0]) if end_season is not None else 9999
+        averages = ', '.join(SEASON_STAT_SQL[column] for column in STAT_COLUMNS)
+        with self.reading() as connection:
+            rows = connection.execute(f'''
+                SELECT seasons.label, SUM(games), {averages}
+                FROM season_totals JOIN seasons ON seasons.id = season_totals.season_id
+                WHERE player_id = ? AND season_id BETWEEN ? AND ?
+                GROUP BY season_id ORDER BY season_id
+            ''', (player_id, start, end)).fetchall()
+        return [dict(zip(['season', 'games'] + [stat_key(column) for column in STAT_COLUMNS], row))
+                for row in rows]
+
+    def season_leaderboard(self, stat, start_season, end_season=None, n=10, min_games=1):
+        """Return the n best (Name, per-game value, games) over a range of seasons.
+
+        Uses the season index on season_totals, so only the seasons in range are read.
+        """
+        column = resolve_stat(stat)
+        start = int(str(start_season).split('-')[0])
+        end = int(str(end_season).split('-')[0]) if end_season is not None else start
+        with self.reading() as connection:
+            rows = connection.execute(f'''
+                SELECT players.name, {SEASON_STAT_SQL[column]} AS value, SUM(games)
+                FROM season_totals JOIN players ON players.id = season_totals.player_id
+                WHERE season_id BETWEEN ? AND ?
+                GROUP BY season_totals.player_id
+                HAVING SUM(games) >= ? AND value IS NOT NULL
+                ORDER BY value DESC, players.name LIMIT ?
+            ''', (start, end, min_games, n)).fetchall()
+        return [tuple(row) for row in rows]
+
     def get_valid_number(self, prompt):
         """Get and validate a numeric input from the user."""
         while True:
@@ -329,25 +1705,32 @@ class BasketballStats:
         stat = self.select_stat()
 
         if stat:
-            # Map user-friendly stat names to SQL-friendly column names
-            stat_mapping = {
-                'points': 'Points',
-                'assists': 'Assists',
-                'rebounds': 'Rebounds',
-                'fg%': 'FG_percent',
-                '3pt%': 'ThreePT_percent'
-            }
-            
-            sql_stat = stat_mapping.get(stat, stat)
+            try:
+                value = self.get_player_stat(player_name, stat)
+            except KeyError:
+                print("Player not found.")
+            else:
+                print(f"{player_name}'s {stat.replace('_', ' ')}: {value}")
 
-            with self.connection:
-                cursor = self.connection.cursor()
-                cursor.execute(f'SELECT "{sql_stat}" FROM stats WHERE Name = ?', (player_name,))
-                result = cursor.fetchone()
-                if result:
-                    print(f"{player_name}'s {stat.replace('_', ' ')}: {result[0]}")
-                else:
-                    print("Player not found.")
+    def get_player_stat(self, player_name, stat):
+        """Return one stat for a player; raise KeyError if the player is not in the database."""
+        column = resolve_stat(stat)
+        with self.reading() as connection:
+            result = connection.execute(f'SELECT "{column}" FROM stats WHERE Name = ?', (player_name,)).fetchone()
+        if result is None:
+            raise KeyError(player_name)
+        return result[0]
+
+    def filter_players(self, stat, min_value=None, max_value=None):
+        """Return (Name, value) for every player whose stat lies within [min_value, max_value]."""
+        column = resolve_stat(stat)
+        low = float('-inf') if min_value is None else min_value
+        high = float('inf') if max_value is None else max_value
+        with self.reading() as connection:
+            rows = connection.execute(
+                f'SELECT Name, "{column}" FROM stats WHERE "{column}" BETWEEN ? AND ? ORDER BY "{column}" DESC, id',
+                (low, high))
+            return [tuple(row) for row in rows]
 
     
     def find_average_stat(self):
@@ -371,22 +1754,12 @@ class BasketballStats:
         if stat_choice in stat_mapping:
             stat = stat_mapping[stat_choice]
 
-            with self.connection:
-                cursor = self.connection.cursor()
-                
-             
-                cursor.execute(f'SELECT AVG("{stat}") FROM stats')
-                result = cursor.fetchone()
-                
-                if result:
-                    average_value = result[0]
-                    
-                    if average_value is not None:
-                        print(f"\nThe average {stat.replace('_', ' ')} is {average_value:.2f}.")
-                    else:
-                        print(f"No data found for {stat.replace('_', ' ')}.")
-                else:
-                    print(f"No data found for {stat.replace('_', ' ')}.")
+            average_value = self.get_average(stat)
+
+            if average_value is not None:
+                print(f"\nThe average {stat.replace('_', ' ')} is {average_value:.2f}.")
+            else:
+                print(f"No data found for {stat.replace('_', ' ')}.")
         else:
             print("Invalid choice. Please select a number between 1 and 5.")
 
@@ -411,35 +1784,134 @@ class BasketballStats:
         if stat_choice in stat_mapping:
             stat = stat_mapping[stat_choice]
 
-            with self.connection:
-                cursor = self.connection.cursor()
-                
-                
-                cursor.execute(f'SELECT MAX("{stat}"), MIN("{stat}") FROM stats')
-                result = cursor.fetchone()
-                
-                if result:
-                    max_value, min_value = result
-                    
-                    # Find players with the max and min values
-                    cursor.execute(f'SELECT Name FROM stats WHERE "{stat}" = ?', (max_value,))
-                    max_players = cursor.fetchall()
-                    cursor.execute(f'SELECT Name FROM stats WHERE "{stat}" = ?', (min_value,))
-                    min_players = cursor.fetchall()
-
-                    if max_players and min_players:
-                        max_names = ", ".join([player[0] for player in max_players])
-                        min_names = ", ".join([player[0] for player in min_players])
-
-                        print(f"\nThe highest {stat.replace('_', ' ')} is {max_value:.2f} by {max_names}.")
-                        print(f"The lowest {stat.replace('_', ' ')} is {min_value:.2f} by {min_names}.")
-                    else:
-                        print(f"No data found for {stat.replace('_', ' ')}.")
-                else:
-                    print(f"No data found for {stat.replace('_', ' ')}.")
+            max_value, max_names, min_value, min_names = self.get_high_low(stat)
+
+            if max_names and min_names:
+                print(f"\nThe highest {stat.replace('_', ' ')} is {max_value:.2f} by {', '.join(max_names)}.")
+                print(f"The lowest {stat.replace('_', ' ')} is {min_value:.2f} by {', '.join(min_names)}.")
+            else:
+                print(f"No data found for {stat.replace('_', ' ')}.")
         else:
             print("Invalid choice. Please select a number between 1 and 5.")
 
+    def get_average(self, stat):
+        """Return the average of a stat across all players (served from the aggregate cache)."""
+        with self.reading():  # Taken before the cache lock, in the same order as writing()
+            return self.aggregates.average(resolve_stat(stat))
+
+    def get_high_low(self, stat):
+        """Return (high value, names with it, low value, names with it) for a stat.
+
+        Each side is one scan of the stat's index that stops as soon as the value changes.
+        """
+        column = resolve_stat(stat)
+        max_value, max_names = self.stat_leaders(column, descending=True)
+        min_value, min_names = self.stat_leaders(column, descending=False)
+        return max_value, max_names, min_value, min_names
+
+    def stat_leaders(self, column, descending):
+        """Return (value, names) for the highest (or lowest) value of a stats column."""
+        order = 'DESC' if descending else 'ASC'
+        with self.reading() as connection:
+            cursor = connection.execute(
+                f'SELECT "{column}", Name FROM stats WHERE "{column}" IS NOT NULL ORDER BY "{column}" {order}, Name')
+            first = cursor.fetchone()
+            if first is None:
+                return None, []
+            names = [first[1]]
+            for value, name in cursor:
+                if value != first[0]:
+                    break
+                names.append(name)
+        return first[0], sorted(names)
+
+    def leaderboard(self, stat, n=10, bottom=False):
+        """Return the top (or bottom) n players for a stat with their rank and dense rank.
+
+        Each entry is {'rank', 'dense_rank', 'name', 'value'}. The inner query reads only n
+        rows from the stat's index, so there is no sort of the whole table; the window
+        functions then rank just those rows.
+        """
+        column = resolve_stat(stat)
+        order = 'ASC' if bottom else 'DESC'
+        with self.reading() as connection:
+            rows = connection.execute(f'''
+                SELECT RANK() OVER (ORDER BY value {order}), DENSE_RANK() OVER (ORDER BY value {order}), Name, value
+                FROM (SELECT Name, "{column}" AS value FROM stats WHERE "{column}" IS NOT NULL
+                      ORDER BY "{column}" {order}, Name LIMIT ?)
+                ORDER BY value {order}, Name
+            ''', (n,)).fetchall()
+        return [dict(zip(['rank', 'dense_rank', 'name', 'value'], row)) for row in rows]
+
+    def percentile_rank(self, player_name, stat):
+        """Return where a player stands for a stat: rank, dense rank and percentile (0-100).
+
+        The percentile is the share of other players with a lower value, like SQL's
+        PERCENT_RANK(). Raises KeyError if the player is not in the database or has no value.
+        """
+        column = resolve_stat(stat)
+        value = self.get_player_stat(player_name, column)
+        if value is None:
+            raise KeyError(player_name)
+        # Each count is a range scan of the stat's index
+        with self.reading() as connection:
+            above, distinct_above, below, total = connection.execute(f'''
+                SELECT (SELECT COUNT(*) FROM stats WHERE "{column}" > :value),
+                       (SELECT COUNT(DISTINCT "{column}") FROM stats WHERE "{column}" > :value),
+                       (SELECT COUNT(*) FROM stats WHERE "{column}" < :value),
+                       (SELECT COUNT("{column}") FROM stats)
+            ''', {'value': value}).fetchone()
+        return {
+            'name': player_name,
+            'value': value,
+            'rank': above + 1,
+            'dense_rank': distinct_above + 1,
+            'percentile': 100.0 * below / (total - 1) if total > 1 else 100.0
+        }
+
+    def summarize(self, stats=None, group_by=None, percentiles=DEFAULT_PERCENTILES):
+        """Compute count, mean, min, max, stddev and percentiles for several stats at once.
+
+        Everything is computed by a single SQL query, i.e. one pass over the table. Returns
+        {stat: {'count': ..., 'mean': ..., 'min': ..., 'max': ..., 'stddev': ..., 'p50': ...}},
+        or {group value: {stat: {...}}} when group_by is given.
+        """
+        columns = [resolve_stat(stat) for stat in (stats or STAT_COLUMNS)]
+        percentiles = resolve_percentiles(percentiles)
+        if group_by is not None and str(group_by).lower() not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by '{group_by}'. Choose from: {', '.join(GROUP_COLUMNS)}.")
+        group_column = GROUP_COLUMNS[str(group_by).lower()] if group_by is not None else None
+
+        selects = []
+        for column in columns:
+            selects += [f'COUNT("{column}")', f'AVG("{column}")', f'MIN("{column}")',
+                        f'MAX("{column}")', f'stddev("{column}")']
+            if percentiles:
+                selects.append(f'percentiles("{column}", :percentiles)')
+        query = f'SELECT {", ".join(selects)} FROM stats'
+        if group_column:
+            query = f'SELECT "{group_column}", {", ".join(selects)} FROM stats GROUP BY "{group_column}"'
+
+        width = 6 if percentiles else 5
+        results = {}
+        with self.reading() as connection:
+            rows = connection.execute(query, {'percentiles': ','.join(str(p) for p in percentiles)}).fetchall()
+        for row in rows:
+            values = row[1:] if group_column else row
+            summary = {}
+            for i, column in enumerate(columns):
+                chunk = values[i * width:(i + 1) * width]
+                entry = dict(zip(['count', 'mean', 'min', 'max', 'stddev'], chunk))
+                if percentiles:
+                    for percentile, value in zip(percentiles, json.loads(chunk[5])):
+                        entry[f'p{percentile:g}'] = value
+                summary[stat_key(column)] = entry
+            if group_column:
+                results[row[0]] = summary
+            else:
+                results = summary
+        return results
+
     def select_stat(self):
         """Allow the user to select a stat from a menu."""
         print("\nSelect a stat to view:")
@@ -460,6 +1932,198 @@ class BasketballStats:
         return None
 
 
+def build_parser():
+    """Create the command line parser for the basketball tool."""
+    parser = argparse.ArgumentParser(prog='basketball', description="Query and edit the basketball stats database.")
+    parser.add_argument('--csv', default='basketball_data.csv',
+                        help="CSV, Parquet or Arrow file the database is loaded from")
+    parser.add_argument('--db', default='basketball.db', help="database file (:memory: to rebuild on every run)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    parser.add_argument('--slow-query-ms', type=float,
+                        help="print statements slower than this many milliseconds to stderr")
+    parser.add_argument('--metrics', help="file to write query statistics to in Prometheus text format on exit")
+    commands = parser.add_subparsers(dest='command')
+
+    commands.add_parser('menu', help="start the interactive menus (the default)")
+
+    query = commands.add_parser('query', help="look up stats")
+    query.add_argument('--stat', action='append', help="stat to query (repeat for several)")
+    mode = query.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--player', help="show the stat for one player")
+    mode.add_argument('--top', type=int, metavar='N', help="show the N players with the highest stat")
+    mode.add_argument('--bottom', type=int, metavar='N', help="show the N players with the lowest stat")
+    mode.add_argument('--rank', metavar='PLAYER', help="show a player's rank and percentile for the stat")
+    mode.add_argument('--leaderboard', type=int, metavar='N', help="show the top N players with their ranks")
+    mode.add_argument('--average', action='store_true', help="show the average of each stat")
+    mode.add_argument('--high-low', action='store_true', help="show the highest and lowest value of the stat")
+    mode.add_argument('--summary', action='store_true', help="show count, mean, min, max, stddev and percentiles")
+
+    for command, text in [('add', "add a player"), ('update', "change a player's stats")]:
+        editor = commands.add_parser(command, help=text)
+        editor.add_argument('name', help="the player's full name")
+        for stat, option in STAT_OPTIONS.items():
+            editor.add_argument(option, dest=stat, type=float, help=f"new {stat} value")
+
+    delete = commands.add_parser('delete', help="delete a player")
+    delete.add_argument('name', help="the player's full name")
+
+    commands.add_parser('undo', help="undo the last add, update or delete")
+    commands.add_parser('redo', help="redo the last undone change")
+    commands.add_parser('reload', help="load the CSV file again and show how fast it loaded")
+    replicate = commands.add_parser('replicate', help="bring a copy of the database in another file up to date")
+    replicate.add_argument('path', help="database file to copy the changes to")
+
+    export = commands.add_parser('export', help="write all player stats as CSV, JSON Lines, Parquet or Arrow")
+    export.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    export.add_argument('--output', default='-', help="file to write (- for stdout)")
+    export.add_argument('--stat', action='append', help="stat to include (repeat for several)")
+
+    batch = commands.add_parser('batch', help="run one command per line from a file, on one connection")
+    batch.add_argument('file', nargs='?', default='-', help="file with commands (- for stdin)")
+    return parser
+
+
+def run_command(stats, args):
+    """Run one parsed command against an open BasketballStats and return its result."""
+    if args.command == 'query':
+        stat_names = args.stat or ['points']
+        if args.player:
+            return {stat_key(resolve_stat(stat)): stats.get_player_stat(args.player, stat) for stat in stat_names}
+        if args.top is not None:
+            return stats.top_n(stat_names[0], args.top)
+        if args.bottom is not None:
+            return stats.top_n(stat_names[0], args.bottom, ascending=True)
+        if args.rank:
+            return stats.percentile_rank(args.rank, stat_names[0])
+        if args.leaderboard is not None:
+            entries = stats.leaderboard(stat_names[0], args.leaderboard)
+            return [(f"{entry['rank']}. {entry['name']}", entry['value']) for entry in entries]
+        if args.average:
+            return stats.averages(args.stat)
+        if args.high_low:
+            max_value, max_names, min_value, min_names = stats.get_high_low(stat_names[0])
+            return {'high': max_value, 'high_players': max_names, 'low': min_value, 'low_players': min_names}
+        return stats.summarize(args.stat)
+
+    if args.command in ('add', 'update'):
+        values = {stat: getattr(args, stat) for stat in STAT_OPTIONS if getattr(args, stat) is not None}
+        if args.command == 'add':
+            stats.insert_player(args.name, values)
+            return {'added': args.name}
+        if not values:
+            raise ValueError(f"No stats given. Use {', '.join(STAT_OPTIONS.values())}.")
+        changed = stats.update_player(args.name, values)
+        if not changed:
+            raise KeyError(args.name)
+        return {'updated': changed}
+
+    if args.command == 'delete':
+        deleted = stats.remove_player(args.name)
+        if not deleted:
+            raise KeyError(args.name)
+        return {'deleted': deleted}
+
+    if args.command in ('undo', 'redo'):
+        batch_id = getattr(stats, args.command)()
+        if batch_id is None:
+            raise ValueError(f"Nothing to {args.command}.")
+        return {args.command: batch_id}
+
+    if args.command == 'reload':
+        stats.ensure_loaded()
+        if stats.last_load_stats is None:  # The database was already up to date
+            stats.reload_data()
+        return stats.last_load_stats
+
+    if args.command == 'replicate':
+        return {'replicated': stats.replicate_to(args.path)}
+
+    if args.command == 'export':
+        stats.export_stats(args.output, args.format, args.stat)
+        return None
+
+    raise ValueError(f"Unknown command '{args.command}'.")
+
+
+def print_result(result, as_json, out=None):
+    """Print a command result as JSON or as plain 'key: value' lines."""
+    out = out or sys.stdout
+    if result is None:
+        return
+    if as_json:
+        out.write(json.dumps(result) + "\n")
+    elif isinstance(result, dict):
+        for key, value in result.items():
+            out.write(f"{key}: {json.dumps(value) if isinstance(value, (dict, list)) else value}\n")
+    else:
+        for name, value in result:
+            out.write(f"{name}: {value}\n")
+
+
+def run_batch(stats, parser, path, as_json):
+    """Run every command in a file (or stdin) against the same connection; returns the error count."""
+    file = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    errors = 0
+    try:
+        for line in file:
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            try:
+                args = parser.parse_args(words)
+                if args.command in (None, 'menu', 'batch'):
+                    raise ValueError("menu and batch cannot be used inside a batch.")
+                print_result(run_command(stats, args), as_json or args.json)
+            except SystemExit:
+                errors += 1  # argparse already printed the problem
+            except KeyError as error:
+                print(f"Player not found in '{line.strip()}': {error.args[0]}", file=sys.stderr)
+                errors += 1
+            except (ValueError, ImportError) as error:
+                print(f"Error in '{line.strip()}': {error}", file=sys.stderr)
+                errors += 1
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    return errors
+
+
+def main(argv=None):
+    """Entry point for the command line; returns the process exit code."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    slow_seconds = SLOW_QUERY_SECONDS
+    handler = None
+    if args.slow_query_ms is not None:
+        slow_seconds = args.slow_query_ms / 1e3
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('slow query: %(message)s'))
+        slow_query_log.addHandler(handler)
+    # The CSV is loaded by the first command that needs it, not before the menu appears
+    stats = BasketballStats(args.csv, db_path=args.db, slow_query_seconds=slow_seconds, lazy=True)
+    try:
+        if args.command in (None, 'menu'):
+            stats.display_menu()
+            return 0
+        if args.command == 'batch':
+            return 1 if run_batch(stats, parser, args.file, args.json) else 0
+        try:
+            print_result(run_command(stats, args), args.json)
+        except KeyError as error:
+            print(f"Player not found: {error.args[0]}", file=sys.stderr)
+            return 1
+        except (ValueError, ImportError) as error:
+            print(f"Error: {error}", file=sys.stderr)
+            return 1
+        return 0
+    finally:
+        if args.metrics:
+            with open(args.metrics, 'w', encoding='utf-8') as file:
+                file.write(stats.profiler.prometheus())
+        stats.close()
+        if handler is not None:
+            slow_query_log.removeHandler(handler)
+
+
 if __name__ == "__main__":
-    stats = BasketballStats('basketball_data.csv')
-    stats.display_menu()
+    sys.exit(main())
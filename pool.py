@@ -0,0 +1,180 @@
+"""
+Connection pool for sharing one basketball stats database between threads.
+"""
+
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+
+from profiler import ProfiledConnection
+
+POOL_SIZE = 4  # Reader connections kept open by default
+
+
+def memory_uri():
+    """Return a URI for a new in-memory database that other connections can open."""
+    return f'file:basketball-{uuid.uuid4().hex}?mode=memory&cache=shared'
+
+
+class ReadWriteLock:
+    """Lets any number of readers in at once, or one writer on its own.
+
+    A waiting writer stops new readers from starting, so writes are not starved.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.writers_waiting = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self.condition:
+            while self.writing or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+
+
+class ConnectionPool:
+    """Read-only connections for parallel queries plus one shared writer connection.
+
+    For a file database in WAL mode, readers run alongside the writer and see the last
+    committed data. In-memory databases must be opened with memory_uri() (shared cache).
+    Shared-cache connections lock whole tables, so there a ReadWriteLock keeps readers
+    and the writer apart.
+
+    A thread keeps one reader for all its nested reads, so a query made while iterating
+    over another one's rows cannot wait for a connection the thread itself holds.
+    """
+
+    def __init__(self, database, writer, size=POOL_SIZE, configure=None):
+        self.database = database
+        self.writer = writer
+        self.size = size
+        self.configure = configure  # Called with each new reader connection
+        self.shared_cache = 'mode=memory' in database
+        self.rw_lock = ReadWriteLock() if self.shared_cache else None
+        self.write_lock = threading.RLock()
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()  # The reader the current thread has borrowed, if any
+        self.closed = False
+
+    def open_reader(self):
+        """Open one read-only connection."""
+        if self.shared_cache:
+            connection = sqlite3.connect(self.database, uri=True, check_same_thread=False,
+                                         factory=ProfiledConnection)
+            connection.execute('PRAGMA query_only = 1')
+        else:
+            from urllib.request import pathname2url  # Slow to import; only file databases need it
+
+            uri = 'file:' + pathname2url(os.path.abspath(self.database)) + '?mode=ro'
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=ProfiledConnection)
+        if self.configure is not None:
+            self.configure(connection)
+        return connection
+
+    def acquire(self):
+        """Take an idle reader, opening a new one while fewer than size are open."""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                try:
+                    return self.open_reader()
+                except Exception:
+                    self.opened -= 1
+                    raise
+        return self.idle.get()
+
+    def release(self, connection):
+        """Hand a reader back to the pool."""
+        if connection.in_transaction:
+            connection.rollback()
+        self.idle.put(connection)
+
+    def reader_in_use(self):
+        """Return the reader the current thread is inside read() with, or None."""
+        return getattr(self.local, 'connection', None)
+
+    @contextlib.contextmanager
+    def read(self):
+        """Borrow a reader connection for the duration of the with block.
+
+        Nested reads on the same thread get the connection already borrowed.
+        """
+        if self.closed:
+            raise sqlite3.ProgrammingError("Cannot use a closed connection pool.")
+        held = self.reader_in_use()
+        if held is not None:
+            yield held
+            return
+        connection = self.acquire()
+        self.local.connection = connection
+        try:
+            if self.rw_lock is not None:
+                with self.rw_lock.read():
+                    yield connection
+            else:
+                yield connection
+        finally:
+            if self.reader_in_use() is connection:
+                self.local.connection = None
+            self.release(connection)
+
+    @contextlib.contextmanager
+    def write(self):
+        """Hold the writer connection, alone, for the duration of the with block.
+
+        Raises sqlite3.ProgrammingError on a shared-cache database if the current thread is
+        still reading (e.g. iterating over a query's rows), since the write would wait forever.
+        """
+        if self.rw_lock is not None and self.reader_in_use() is not None:
+            raise sqlite3.ProgrammingError("Cannot change the database while reading from it on the same thread; "
+                                           "finish reading the rows first.")
+        with self.write_lock:
+            if self.rw_lock is not None:
+                with self.rw_lock.write():
+                    yield self.writer
+            else:
+                yield self.writer
+
+    def close(self):
+        """Close every reader connection (the writer belongs to its owner)."""
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
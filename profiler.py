@@ -0,0 +1,314 @@
+"""
+Query profiling for the BasketballStats database.
+
+Every statement goes through ProfiledConnection and ProfiledCursor, which record
+per-query latency histograms, rows returned and SQLite VM steps in a QueryProfiler.
+"""
+
+import collections
+import functools
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # Histogram upper bounds (s)
+SLOW_QUERY_SECONDS = 0.1  # Statements slower than this are written to the slow query log
+PROGRESS_STEPS = 1000  # SQLite VM instructions between progress handler calls
+ITER_BATCH_SIZE = 256  # Rows fetched (and timed) at a time when a cursor is iterated
+
+slow_query_log = logging.getLogger('basketball.slow_queries')
+slow_query_log.addHandler(logging.NullHandler())  # Silent unless the application adds a handler
+
+
+@functools.lru_cache(maxsize=1024)
+def query_key(sql):
+    """Collapse the whitespace of a statement so the same query is always counted together."""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class QueryStats:
+    """Counters and latency histogram for one statement."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.steps = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # The last bucket is +Inf
+        self.last_params = ()
+
+    def add(self, seconds, rows, steps, params):
+        """Record one execution."""
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.rows += rows
+        self.steps += steps
+        self.last_params = params
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, percent):
+        """Estimate a latency percentile (in seconds) as the upper bound of its histogram bucket."""
+        target = self.calls * percent / 100
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max_seconds
+
+
+class QueryProfiler:
+    """Collects QueryStats per statement and logs statements slower than slow_seconds.
+
+    VM steps are counted by a progress handler every PROGRESS_STEPS instructions and are a
+    proxy for rows scanned: a full table scan takes far more steps than an index search
+    returning the same rows.
+    """
+
+    def __init__(self, slow_seconds=SLOW_QUERY_SECONDS, explain_slow=False):
+        self.slow_seconds = slow_seconds
+        self.explain_slow = explain_slow  # Add the query plan to slow query log entries
+        self.queries = {}
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def attach(self, connection):
+        """Start counting VM steps on a connection (the first one attached also runs EXPLAIN)."""
+        if self.connection is None:
+            self.connection = connection
+        connection.steps = 0
+
+        def count_steps():
+            connection.steps += PROGRESS_STEPS
+            return 0
+
+        connection.set_progress_handler(count_steps, PROGRESS_STEPS)
+
+    def record(self, sql, params, seconds, rows, steps):
+        """Add one finished execution and log it if it was slow."""
+        key = query_key(sql)
+        with self.lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = QueryStats()
+            stats.add(seconds, rows, steps, params)
+        if self.slow_seconds is not None and seconds >= self.slow_seconds:
+            message = f"{seconds * 1e3:.1f} ms, {rows} rows, ~{steps} steps: {key}"
+            if self.explain_slow and self.connection is not None:
+                message += " | " + "; ".join(self.explain(sql, params))
+            slow_query_log.warning(message)
+
+    def explain(self, sql, params=()):
+        """Return the EXPLAIN QUERY PLAN lines for a statement."""
+        # The plain sqlite3 cursor keeps EXPLAIN itself out of the statistics
+        cursor = sqlite3.Cursor(self.connection)
+        # A cached EXPLAIN statement is not recompiled after a schema change, so the
+        # schema version is put in the SQL text to get a fresh statement when it changes
+        version = cursor.execute('PRAGMA schema_version').fetchone()[0]
+        return [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN /* schema {version} */ {sql}', params)]
+
+    def full_scans(self):
+        """Return {statement: plan} for recorded SELECT statements that scan a whole table."""
+        with self.lock:
+            recorded = [(key, stats.last_params) for key, stats in self.queries.items()]
+        scans = {}
+        for key, params in recorded:
+            if not key.upper().startswith(('SELECT', 'WITH')):
+                continue
+            try:
+                plan = self.explain(key, params)
+            except sqlite3.Error:
+                continue  # A table the statement used has been dropped since
+            if any(line.startswith('SCAN') and 'INDEX' not in line for line in plan):
+                scans[key] = plan
+        return scans
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self.lock:
+            self.queries.clear()
+
+    def dump_stats(self, sort_by='seconds'):
+        """Return one dict per statement, slowest (by total time) first."""
+        with self.lock:
+            items = list(self.queries.items())
+        entries = []
+        for key, stats in items:
+            entries.append({
+                'query': key,
+                'calls': stats.calls,
+                'seconds': stats.seconds,
+                'mean_ms': stats.seconds / stats.calls * 1e3,
+                'p95_ms': stats.percentile(95) * 1e3,
+                'max_ms': stats.max_seconds * 1e3,
+                'rows': stats.rows,
+                'steps': stats.steps
+            })
+        return sorted(entries, key=lambda entry: entry[sort_by], reverse=True)
+
+    def prometheus(self):
+        """Return the statistics in the Prometheus text exposition format."""
+        def label(key):
+            return key.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        with self.lock:
+            items = sorted(self.queries.items())
+        lines = ['# HELP basketball_query_duration_seconds Time spent executing and fetching a statement.',
+                 '# TYPE basketball_query_duration_seconds histogram']
+        for key, stats in items:
+            total = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+                total += count
+                lines.append(f'basketball_query_duration_seconds_bucket{{query="{label(key)}",le="{bound}"}} {total}')
+            lines.append(f'basketball_query_duration_seconds_sum{{query="{label(key)}"}} {stats.seconds}')
+            lines.append(f'basketball_query_duration_seconds_count{{query="{label(key)}"}} {stats.calls}')
+        lines += ['# HELP basketball_query_rows_total Rows returned by a statement.',
+                  '# TYPE basketball_query_rows_total counter']
+        lines += [f'basketball_query_rows_total{{query="{label(key)}"}} {stats.rows}' for key, stats in items]
+        lines += ['# HELP basketball_query_vm_steps_total Approximate SQLite VM instructions run by a statement.',
+                  '# TYPE basketball_query_vm_steps_total counter']
+        lines += [f'basketball_query_vm_steps_total{{query="{label(key)}"}} {stats.steps}' for key, stats in items]
+        return "\n".join(lines) + "\n"
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that adds up the time a statement spends in execute and in fetching its rows.
+
+    Time the caller spends between fetches (e.g. waiting at a paging prompt) is not
+    counted. The statement is recorded once its rows are used up or the cursor is dropped.
+    Iterating fetches ITER_BATCH_SIZE rows at a time, so the timing is not paid per row.
+    """
+
+    pending = None
+    buffered = ()  # Rows fetched for iteration but not yet returned
+
+    def execute(self, sql, params=()):
+        self.finish()
+        self.start(sql, params)
+        try:
+            self.timed(super().execute, sql, params)
+        except Exception:
+            self.pending = None
+            raise
+        if self.description is None:
+            self.pending[3] = max(self.rowcount, 0)  # Rows changed by INSERT, UPDATE or DELETE
+            self.finish()
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.finish()
+        self.start(sql, ())
+        try:
+            self.timed(super().executemany, sql, seq_of_params)
+        except Exception:
+            self.pending = None
+            raise
+        self.pending[3] = max(self.rowcount, 0)
+        self.finish()
+        return self
+
+    def start(self, sql, params):
+        """Begin recording a statement: [sql, params, seconds, rows, steps]."""
+        self.pending = [sql, params, 0.0, 0, 0]
+        self.buffered = ()
+
+    def timed(self, call, *args):
+        """Run one call into SQLite and add its time and VM steps to the statement being recorded."""
+        steps = self.connection.steps
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            if self.pending is not None:
+                self.pending[2] += time.perf_counter() - started
+                self.pending[4] += self.connection.steps - steps
+
+    def finish(self):
+        """Record the statement being timed, if there is one."""
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            self.connection.profiler.record(*pending)
+
+    def count(self, rows, done):
+        """Add fetched rows to the statement being timed and finish it once it has no more rows."""
+        if self.pending is not None:
+            self.pending[3] += rows
+            if done:
+                self.finish()
+
+    def take_buffered(self, size):
+        """Return up to size rows left over from iteration."""
+        rows = []
+        while self.buffered and len(rows) < size:
+            rows.append(self.buffered.popleft())
+        return rows
+
+    def fetchone(self):
+        if self.buffered:
+            return self.buffered.popleft()
+        row = self.timed(super().fetchone)
+        self.count(row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self.take_buffered(size)
+        if len(rows) < size:
+            fetched = self.timed(super().fetchmany, size - len(rows))
+            self.count(len(fetched), len(fetched) < size - len(rows))
+            rows += fetched
+        return rows
+
+    def fetchall(self):
+        rows = self.take_buffered(len(self.buffered))
+        fetched = self.timed(super().fetchall)
+        self.count(len(fetched), True)
+        return rows + fetched
+
+    def __next__(self):
+        if not self.buffered:
+            self.buffered = collections.deque(self.fetchmany(ITER_BATCH_SIZE))
+            if not self.buffered:
+                raise StopIteration
+        return self.buffered.popleft()
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self.finish()
+        except Exception:
+            pass  # The connection may already be gone at interpreter exit
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors (including those made by execute and executemany) are profiled.
+
+    Use with sqlite3.connect(path, factory=ProfiledConnection); the QueryProfiler is in
+    the profiler attribute.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = QueryProfiler()
+        self.profiler.attach(self)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
@@ -0,0 +1,326 @@
+"""
+Fetching pages from Basketball Reference through an on-disk HTTP cache.
+
+requests and BeautifulSoup are imported the first time they are needed, so importing
+this module (for its classes and settings) does not slow down commands that never scrape.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+BBREF_URL = 'https://www.basketball-reference.com'
+CACHE_DIR = '.bbref_cache'
+CACHE_TTL = 24 * 60 * 60  # Seconds a cached page is used without asking the server
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # Least recently used pages are evicted past this size
+REQUEST_TIMEOUT = 30
+REQUESTS_PER_SECOND = 0.3  # Basketball Reference allows about 20 requests a minute
+RETRIES = 3
+RETRY_BACKOFF = 2.0  # Seconds before the first retry; doubled after each attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+INDEX_FILE = 'player_index.json'
+INDEX_TTL = 7 * 24 * 60 * 60  # Seconds before a letter of the player index is refreshed
+NAME_SUFFIXES = {'jr', 'jr.', 'sr', 'sr.', 'ii', 'iii', 'iv', 'v'}
+
+
+def make_session(pool_size=10):
+    """Create a requests.Session that keeps up to pool_size connections open per host."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = 'py-basketball (+https://github.com/spatil11-umd/py-basketball)'
+    return session
+
+
+class HTTPCache:
+    """Disk cache for GET requests with TTL, ETag/Last-Modified revalidation and LRU eviction.
+
+    Each page is stored as two files named after the SHA-256 of its URL: the body and a
+    small JSON file with its validators. A page younger than ttl is served without any
+    network traffic; an older page is revalidated with a conditional request, and a 304
+    answer keeps the stored body.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, session=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.session = session if session is not None else make_session()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, url):
+        """Return the body and metadata file paths for a URL."""
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.html'), os.path.join(self.directory, key + '.json')
+
+    def read(self, url):
+        """Return (metadata, body) for a cached URL, or (None, None) if it is not cached."""
+        body_path, meta_path = self.paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as file:
+                meta = json.load(file)
+            with open(body_path, encoding='utf-8') as file:
+                body = file.read()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def is_fresh(self, url):
+        """Return True if the URL is cached and younger than the TTL."""
+        try:
+            with open(self.paths(url)[1], encoding='utf-8') as file:
+                return time.time() - json.load(file)['fetched_at'] < self.ttl
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def write(self, url, meta, body=None):
+        """Store the metadata (and body, if given) for a URL."""
+        body_path, meta_path = self.paths(url)
+        with self.lock:
+            if body is not None:
+                with open(body_path, 'w', encoding='utf-8') as file:
+                    file.write(body)
+            with open(meta_path, 'w', encoding='utf-8') as file:
+                json.dump(meta, file)
+            os.utime(body_path)  # The body's mtime is the last access time used for LRU
+
+    def get(self, url):
+        """Return the text of a page, using the cache whenever possible."""
+        meta, body = self.read(url)
+        now = time.time()
+
+        if meta is not None and now - meta['fetched_at'] < self.ttl:
+            with self.lock:
+                try:
+                    os.utime(self.paths(url)[0])
+                except OSError:
+                    meta = None  # Evicted by another thread since it was read; fetch it again
+                else:
+                    self.hits += 1
+                    return body
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and meta is not None:
+            self.revalidations += 1
+            meta['fetched_at'] = now
+            self.write(url, meta, body)  # The body is written again in case it was evicted meanwhile
+            return body
+
+        response.raise_for_status()
+        self.misses += 1
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now
+        }
+        self.write(url, meta, response.text)
+        self.evict()
+        return response.text
+
+    def evict(self):
+        """Delete the least recently used pages until the cache fits in max_bytes."""
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.html'):
+                    info = entry.stat()
+                    entries.append((info.st_mtime, info.st_size, entry.path))
+                    total += info.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                for stale in (path, path[:-len('.html')] + '.json'):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                total -= size
+
+    def clear(self):
+        """Delete every cached page."""
+        with self.lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(('.html', '.json')):
+                    os.remove(entry.path)
+
+
+class RateLimiter:
+    """Spaces out requests to each host so that no more than rate requests per second are sent."""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until a request to the URL's host is allowed."""
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def fetch_with_retries(cache, url, limiter=None, retries=RETRIES, backoff=RETRY_BACKOFF):
+    """Fetch a page through the cache, retrying timeouts, dropped connections and 429/5xx answers."""
+    import requests
+
+    for attempt in range(retries + 1):
+        if limiter is not None and not cache.is_fresh(url):
+            limiter.wait(url)
+        try:
+            return cache.get(url)
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+            response = getattr(error, 'response', None)
+            status = getattr(response, 'status_code', None)
+            if isinstance(error, requests.HTTPError) and status not in RETRY_STATUSES:
+                raise
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            time.sleep(delay)
+
+
+def index_letter(player_name):
+    """Return the letter of the index page that lists a player (the last name's initial)."""
+    words = [word for word in player_name.split() if word.lower() not in NAME_SUFFIXES]
+    if not words:
+        return None
+    letter = words[-1][0].lower()
+    return letter if 'a' <= letter <= 'z' else None
+
+
+class PlayerURLIndex:
+    """Name to player page URL index built from the letter pages (/players/a/ ... /players/z/).
+
+    The index is saved to a JSON file. A letter is downloaded the first time a name under it
+    is looked up and again once it is older than max_age, so existence checks are plain
+    dictionary lookups. Players sharing a name (jamesmi01, jamesmi02) all keep their URL.
+    Each letter has its own lock, so threads looking up names under the same letter wait
+    for one download instead of each fetching the page.
+    """
+
+    def __init__(self, normalize, cache, path=INDEX_FILE, base_url=BBREF_URL, max_age=INDEX_TTL):
+        self.normalize = normalize  # Function turning a name into its lookup key
+        self.cache = cache
+        self.path = path
+        self.base_url = base_url
+        self.max_age = max_age
+        self.letters = {}
+        self.names = {}
+        self.lock = threading.Lock()
+        self.letter_locks = {}
+        self.load()
+
+    def load(self):
+        """Read the saved index, if there is one."""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        if saved.get('base_url') != self.base_url:
+            return
+        for letter, entry in saved.get('letters', {}).items():
+            self.set_letter(letter, entry['players'], entry['fetched_at'])
+
+    def save(self):
+        """Write the index to its JSON file."""
+        data = {'base_url': self.base_url, 'letters': self.letters}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.path)
+
+    def set_letter(self, letter, players, fetched_at):
+        """Replace the players listed under one letter."""
+        old = self.letters.get(letter)
+        if old:
+            for name, url in old['players']:
+                key = self.normalize(name)
+                self.names[key] = [entry for entry in self.names.get(key, []) if entry[1] != url]
+                if not self.names[key]:
+                    del self.names[key]
+        self.letters[letter] = {'fetched_at': fetched_at, 'players': players}
+        for name, url in players:
+            self.names.setdefault(self.normalize(name), []).append((name, url))
+
+    def parse_letter_page(self, page):
+        """Return [name, url] pairs from a letter page's players table."""
+        from bs4 import BeautifulSoup, SoupStrainer
+
+        soup = BeautifulSoup(page, 'html.parser', parse_only=SoupStrainer('table', id='players'))
+        players = []
+        for link in soup.select('th[data-stat="player"] a[href]'):
+            players.append([link.get_text(strip=True), self.base_url + link['href']])
+        return players
+
+    def letter_lock(self, letter):
+        """Return the lock held while a letter is checked and downloaded."""
+        with self.lock:
+            return self.letter_locks.setdefault(letter, threading.Lock())
+
+    def is_stale(self, letter):
+        """Return True if a letter was never downloaded or is older than max_age."""
+        entry = self.letters.get(letter)
+        return entry is None or time.time() - entry['fetched_at'] >= self.max_age
+
+    def refresh_letter(self, letter, limiter=None):
+        """Download one letter page (waiting on limiter, if given) and update the index from it."""
+        page = fetch_with_retries(self.cache, f'{self.base_url}/players/{letter}/', limiter)
+        with self.lock:
+            self.set_letter(letter, self.parse_letter_page(page), time.time())
+            self.save()
+
+    def refresh(self, letters=None, limiter=None):
+        """Refresh every loaded letter (or the given ones) that is older than max_age."""
+        for letter in letters or list(self.letters):
+            with self.letter_lock(letter):
+                if self.is_stale(letter):
+                    self.refresh_letter(letter, limiter)
+
+    def build(self, limiter=None):
+        """Download all 26 letter pages (only the stale ones are downloaded again)."""
+        self.refresh('abcdefghijklmnopqrstuvwxyz', limiter)
+
+    def lookup(self, player_name, limiter=None):
+        """Return the (name, url) pairs of every player with this name; empty if there is none.
+
+        A missing or stale letter page is downloaded first, waiting on limiter if one is given.
+        """
+        letter = index_letter(player_name)
+        if letter is None:
+            return []
+        with self.letter_lock(letter):
+            if self.is_stale(letter):
+                self.refresh_letter(letter, limiter)
+        with self.lock:
+            return list(self.names.get(self.normalize(player_name), []))
+